@@ -0,0 +1,146 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Micro-benchmarks of geometry_core, they need only NumPy.
+#
+#   python benchmarks/bench_geometry_core.py
+#   python -m pytest benchmarks/bench_geometry_core.py --benchmark-only
+#
+# The second form needs pytest-benchmark. The module is loaded from its file,
+# so the addon package (and bpy) isn't imported.
+
+import importlib.util
+import os
+import time
+import numpy as np
+
+core_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "half_knife", "geometry_core.py")
+spec = importlib.util.spec_from_file_location("geometry_core", core_path)
+geometry_core = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(geometry_core)
+
+try:
+    import pytest
+except ImportError:
+    pytest = None
+
+WIDTH = 1920
+HEIGHT = 1080
+
+# a perspective view from (0, 0, 5) looking down -Z
+PERSPECTIVE = np.array((
+    (1.5, 0, 0, 0),
+    (0, 1.5 * WIDTH / HEIGHT, 0, 0),
+    (0, 0, -1.002, 4.81),
+    (0, 0, -1, 5),
+))
+
+
+def sizes(name, values):
+    """pytest parametrize when pytest is there, the values are also used by the plain runner."""
+    def decorator(fn):
+        fn.sizes = (name, values)
+        if pytest:
+            return pytest.mark.parametrize(name, values)(fn)
+        return fn
+    return decorator
+
+def random_points(n, dim = 3, seed = 0):
+    return np.random.default_rng(seed).uniform(-1, 1, (n, dim))
+
+def random_pixels(n, seed = 0):
+    return np.random.default_rng(seed).uniform(0, 1, (n, 2)) * (WIDTH, HEIGHT)
+
+
+@sizes("n", (1000, 100000, 1000000))
+def test_project_points(benchmark, n):
+    co = random_points(n)
+    benchmark(geometry_core.project_points, PERSPECTIVE, WIDTH, HEIGHT, co)
+
+@sizes("n", (1000, 100000, 1000000))
+def test_unproject_points(benchmark, n):
+    px = random_pixels(n)
+    inv = np.linalg.inv(PERSPECTIVE)
+    benchmark(geometry_core.unproject_points, inv, WIDTH, HEIGHT, px, True, (0, 0, 5))
+
+@sizes("n", (4, 32, 1024))
+def test_closest_edge(benchmark, n):
+    # edges of an ngon
+    angle = np.linspace(0, 2 * np.pi, n, endpoint = False)
+    a = np.stack((np.cos(angle), np.sin(angle), np.zeros(n)), axis = 1)
+    b = np.roll(a, -1, axis = 0)
+    benchmark(geometry_core.closest_edge, np.array((.3, .2, 0)), a, b)
+
+@sizes("n", (10, 100, 1000))
+def test_points_on_edges(benchmark, n):
+    points = random_points(n, seed = 1)
+    a = random_points(n, seed = 2)
+    b = random_points(n, seed = 3)
+    benchmark(geometry_core.points_on_edges, points, a, b, .001)
+
+@sizes("n", (1000, 100000, 1000000))
+def test_points_near_segments_2d(benchmark, n):
+    # mesh vertices against the segments of a fan cut from 16 vertices
+    points = random_pixels(n, seed = 1)
+    a = random_pixels(16, seed = 2)
+    b = np.tile((WIDTH / 2, HEIGHT / 2), (16, 1))
+    benchmark(geometry_core.points_near_segments_2d, points, a, b, 2, WIDTH, HEIGHT)
+
+@sizes("n", (4, 50, 1000))
+def test_corner_axes(benchmark, n):
+    # the corners of a pole with n faces, axes every 15°
+    ends = random_points(2 * n, seed = 1).reshape(n, 2, 3)
+    ends /= np.linalg.norm(ends, axis = 2)[..., None]
+    normals = np.cross(ends[:, 0], ends[:, 1])
+    benchmark(geometry_core.corner_axes, ends[:, 0], ends[:, 1], normals, geometry_core.increment_angles(np.pi / 12))
+
+@sizes("n", (3, 12, 180))
+def test_nearest_line(benchmark, n):
+    b = random_points(n, seed = 1)
+    benchmark(geometry_core.nearest_line, np.array((.3, .2, 0)), np.zeros((n, 3)), b)
+
+
+class Benchmark:
+    """The part of the pytest-benchmark fixture which the tests use."""
+
+    min_time = .2
+    min_rounds = 3
+
+    def __call__(self, fn, *args):
+        self.times = []
+        total = 0
+        while len(self.times) < self.min_rounds or total < self.min_time:
+            start = time.perf_counter()
+            fn(*args)
+            duration = time.perf_counter() - start
+            self.times.append(duration)
+            total += duration
+
+def main():
+    print("%-36s %10s %8s %12s %12s" % ("test", "size", "rounds", "min", "mean"))
+    for name, fn in sorted(globals().items()):
+        if not name.startswith("test_"):
+            continue
+        arg, values = fn.sizes
+        for value in values:
+            benchmark = Benchmark()
+            fn(benchmark, **{arg: value})
+            times = benchmark.times
+            print("%-36s %10d %8d %10.3fms %10.3fms" % (name[5:], value, len(times), min(times) * 1000, sum(times) / len(times) * 1000))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Time of a fan cut against the number of start vertices.
+#
+#   blender --background --python benchmarks/multi_vertex_cut.py -- 1 10 100 1000
+#
+# It prints the times only, compare runs before and after a change.
+
+import os
+import sys
+import time
+import bpy
+import bmesh
+import numpy as np
+from mathutils import Vector, Matrix
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+for path in (benchmarks_dir, os.path.dirname(benchmarks_dir)):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from synthetic_view import make_context
+from half_knife import create_fan_mesh
+from half_knife.geometry_math import GeometryMath
+from half_knife.spatial_index import SpatialIndex
+from half_knife.native_cut import NativeCut
+
+
+def make_grid(segments = 200, size = 5):
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments, y_segments = segments, size = size)
+    return bm
+
+def boundary_verts(bm, count):
+    # evenly spaced along the border, sorted by angle around the center
+    border = [v for v in bm.verts if v.is_boundary]
+    border.sort(key = lambda v: np.arctan2(v.co.y, v.co.x))
+    step = max(len(border) // count, 1)
+    return border[::step][:count]
+
+def timed(results, name, fn):
+    start = time.perf_counter()
+    res = fn()
+    results[name] = time.perf_counter() - start
+    return res
+
+def run(count, context, obj):
+    results = {}
+    util = GeometryMath(context, obj)
+    bm = make_grid()
+    starts = [v.co.copy() for v in boundary_verts(bm, count)]
+    end = Vector((.013, .021, 0))
+    co = [end] + starts
+
+    def per_vertex():
+        for c in co:
+            px = util.location_3d_to_region_2d_object_space(c)
+            origin, direction = util.get_view_world_space(px.x, px.y)
+    timed(results, "project per vertex", per_vertex)
+    cut_co, px = timed(results, "project batched", lambda: util.get_cut_points(co))
+    me = timed(results, "cut mesh", lambda: create_fan_mesh("Benchmark", cut_co))
+    bpy.data.meshes.remove(me)
+
+    bm.verts.ensure_lookup_table()
+    verts_px = util.project_array([v.co for v in bm.verts])
+    path = np.array([(p, px[0]) for p in px[1:]])
+    timed(results, "selection path", lambda: util.points_near_segments_2d(verts_px, path[:, 0], path[:, 1], 2))
+
+    tree = SpatialIndex(bm)
+    cut = NativeCut(bm, util, tree)
+    start_verts = boundary_verts(bm, count)
+    timed(results, "native cut", lambda: [cut.cut(v, end) for v in start_verts])
+    bm.free()
+    return results
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    counts = [int(a) for a in argv] or [1, 10, 100, 1000]
+    context = make_context()
+    obj = type("Object", (), {"matrix_world": Matrix.Identity(4)})()
+    rows = [(count, run(count, context, obj)) for count in counts]
+    names = list(rows[0][1].keys())
+    print("%8s" % "verts" + "".join(["%22s" % n for n in names]))
+    for count, results in rows:
+        print("%8d" % count + "".join(["%20.2fms" % (results[n] * 1000) for n in names]))
+
+main()
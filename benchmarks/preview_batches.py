@@ -0,0 +1,120 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Time of the preview of a mouse move: calc_hit finds the snapping target and
+# Draw builds the batches with HeadlessBackend, which keeps them off the GPU.
+#
+#   blender --background --python benchmarks/preview_batches.py -- 32 128 512
+#
+# It prints the times only, compare runs before and after a change.
+
+import os
+import sys
+import time
+import bpy
+import bmesh
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+for path in (benchmarks_dir, os.path.dirname(benchmarks_dir)):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from synthetic_view import make_context
+from half_knife import HalfKnifeCut, MouseMove, preferences
+from half_knife.draw import Draw
+from half_knife.draw_buffers import HeadlessBackend
+
+
+class HeadlessHalfKnife(HalfKnifeCut):
+    # defaults of the operator properties
+    auto_cut = False
+    altitude_mode = False
+    snap_to_center = False
+    snap_to_center_alternate = False
+    cut_through = False
+    turn_off_snapping = False
+    cut_engine = 'BMESH'
+
+
+def make_grid_object(segments):
+    me = bpy.data.meshes.new("Preview benchmark")
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments = segments, y_segments = segments, size = 1)
+    bm.to_mesh(me)
+    bm.free()
+    obj = bpy.data.objects.new(me.name, me)
+    bpy.context.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+    bpy.ops.object.mode_set(mode = 'EDIT')
+    bpy.ops.mesh.select_all(action = 'DESELECT')
+    return obj
+
+def remove_object(obj):
+    bpy.ops.object.mode_set(mode = 'OBJECT')
+    me = obj.data
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(me)
+
+def run(context, obj, prefs, moves):
+    width, height = context.region.width, context.region.height
+    core = HeadlessHalfKnife()
+    core.setup(context, obj, prefs)
+    vert, center = core.addVert(context, MouseMove(.42 * width, .40 * height))
+    if not vert:
+        return None
+    core.initial_vertices = [vert]
+
+    backend = HeadlessBackend()
+    draw = Draw(context, obj.matrix_world, backend)
+    hit_time = batch_time = 0
+    changed = 0
+    for i in range(moves):
+        t = i / max(moves - 1, 1)
+        move = MouseMove(width * (.45 + .15 * t), height * (.45 + .17 * t))
+        start = time.perf_counter()
+        batch = core.calc_hit(context, move)
+        hit_time += time.perf_counter() - start
+        start = time.perf_counter()
+        changed += draw.batch(batch) if batch else draw.clear()
+        batch_time += time.perf_counter() - start
+    return {
+        "calc_hit": hit_time / moves * 1000,
+        "batches": batch_time / moves * 1000,
+        "changed": changed,
+        "vertices": backend.uploaded_vertices,
+        "batch_count": backend.batch_count,
+    }
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    sizes = [int(a) for a in argv] or [32, 128, 512]
+    context = make_context(eye = (.4, -.6, 4))
+    prefs = preferences.HalfKnifePreferencesDefaults()
+    moves = 500
+    print("%10s %12s %12s %8s %10s %8s" % ("faces", "calc_hit", "batches", "changed", "vertices", "built"))
+    for size in sizes:
+        obj = make_grid_object(size)
+        faces = len(obj.data.polygons)
+        r = run(context, obj, prefs, moves)
+        remove_object(obj)
+        if not r:
+            print("%10d  the start point missed the mesh" % faces)
+            continue
+        print("%10d %10.3fms %10.3fms %8d %10d %8d" % (faces, r["calc_hit"], r["batches"], r["changed"], r["vertices"], r["batch_count"]))
+
+main()
@@ -0,0 +1,208 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Scaling benchmark of the cut phases on meshes of increasing density.
+#
+#   blender --background --python benchmarks/run_cut.py -- --output results.json
+#   blender --background --python benchmarks/run_cut.py -- --baseline results.json --threshold .2
+#
+# Cuts go through HalfKnifeCut with the native bmesh engine, the view is
+# synthetic. The phases are the profiler laps of run_cut plus the setup
+# (BVH and caches) and the snapping of the start and end points. The exit code
+# is 1 if a phase got slower than the baseline by more than the threshold.
+# No results are kept in the repository, record a baseline before a change.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import bpy
+import bmesh
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+for path in (benchmarks_dir, os.path.dirname(benchmarks_dir)):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from synthetic_view import make_context
+from half_knife import HalfKnifeCut, MouseMove, preferences, profiler
+
+
+class HeadlessHalfKnife(HalfKnifeCut):
+    # defaults of the operator properties
+    auto_cut = True
+    altitude_mode = False
+    snap_to_center = False
+    snap_to_center_alternate = False
+    cut_through = False
+    turn_off_snapping = False
+    cut_engine = 'BMESH'
+
+
+def grid(bm, n):
+    bmesh.ops.create_grid(bm, x_segments = n, y_segments = n, size = 1)
+
+def uv_sphere(bm, n):
+    bmesh.ops.create_uvsphere(bm, u_segments = n, v_segments = max(n // 2, 3), radius = 1)
+
+def ngon(bm, n):
+    bmesh.ops.create_circle(bm, cap_ends = True, segments = n, radius = 1)
+
+def pole(bm, n):
+    # a triangle fan, the center vertex has n edges
+    bmesh.ops.create_circle(bm, cap_tris = True, segments = n, radius = 1)
+
+MESHES = (
+    ("grid", grid, (32, 128, 512)),
+    ("uv_sphere", uv_sphere, (32, 128, 512)),
+    ("ngon", ngon, (100, 1000, 10000)),
+    ("pole", pole, (32, 256, 2048)),
+)
+
+# start and end of the cuts in fractions of the region size
+CUTS = (
+    ((.42, .40), (.58, .62)),
+    ((.40, .50), (.60, .50)),
+    ((.50, .38), (.47, .63)),
+)
+
+
+def make_object(name, build, size):
+    me = bpy.data.meshes.new(name)
+    bm = bmesh.new()
+    build(bm, size)
+    bm.to_mesh(me)
+    bm.free()
+    obj = bpy.data.objects.new(name, me)
+    bpy.context.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    obj.select_set(True)
+    bpy.ops.object.mode_set(mode = 'EDIT')
+    bpy.ops.mesh.select_all(action = 'DESELECT')
+    return obj
+
+def remove_object(obj):
+    bpy.ops.object.mode_set(mode = 'OBJECT')
+    me = obj.data
+    bpy.data.objects.remove(obj)
+    bpy.data.meshes.remove(me)
+
+def scripted_cut(context, obj, prefs, start, end):
+    """Does what invoke does with auto_cut. Returns the phase timings in ms or None if a point missed the mesh."""
+    timings = {}
+    core = HeadlessHalfKnife()
+    t = time.perf_counter()
+    core.setup(context, obj, prefs)
+    timings["Setup"] = (time.perf_counter() - t) * 1000
+
+    t = time.perf_counter()
+    vert, center = core.addVert(context, MouseMove(*start))
+    if not vert or core.virtual_start:
+        return None
+    core.initial_vertices = [vert]
+    core.calc_hit(context, MouseMove(*end))
+    timings["Snapping"] = (time.perf_counter() - t) * 1000
+    if core.snap_mode == 'VOID':
+        return None
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        core.run_cut()
+    for e in profiler.history[-1].events:
+        timings[e.name] = timings.get(e.name, 0) + e.duration / 1e6
+    bpy.ops.mesh.select_all(action = 'DESELECT')
+    return timings
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+def run(args):
+    context = make_context(eye = (.4, -.6, 4))
+    width, height = context.region.width, context.region.height
+    prefs = preferences.HalfKnifePreferencesDefaults()
+    prefs.use_edge_autofix = False
+    profiler.enabled = True
+
+    cases = {}
+    for name, build, sizes in MESHES:
+        for size in sizes[:2] if args.quick else sizes:
+            case = "%s_%d" % (name, size)
+            obj = make_object(case, build, size)
+            faces = len(obj.data.polygons)
+            phases = {}
+            skipped = 0
+            for r in range(args.repeat):
+                for start, end in CUTS:
+                    timings = scripted_cut(context, obj, prefs, (start[0] * width, start[1] * height), (end[0] * width, end[1] * height))
+                    if not timings:
+                        skipped += 1
+                        continue
+                    for phase, ms in timings.items():
+                        phases.setdefault(phase, []).append(ms)
+            remove_object(obj)
+            cases[case] = {"faces": faces, "skipped_cuts": skipped, "phases": dict([(p, summarize(v)) for p, v in phases.items()])}
+            total = cases[case]["phases"].get("Cut")
+            print("%-20s %8d faces %10.2fms per cut" % (case, faces, total["mean"] if total else float("nan")))
+    return {"blender": bpy.app.version_string, "repeat": args.repeat, "cases": cases}
+
+def compare(results, baseline, threshold, noise):
+    """Phases whose mean got slower than the baseline by more than the threshold fraction and the noise in ms."""
+    regressions = []
+    for case, data in results["cases"].items():
+        base = baseline["cases"].get(case)
+        if not base:
+            continue
+        for phase, s in data["phases"].items():
+            b = base["phases"].get(phase)
+            if b and s["mean"] > b["mean"] * (1 + threshold) and s["mean"] - b["mean"] > noise:
+                regressions.append((case, phase, b["mean"], s["mean"]))
+    return regressions
+
+def main():
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(prog = "run_cut.py")
+    parser.add_argument("--output", help = "write the results to this JSON file")
+    parser.add_argument("--baseline", help = "compare with the results in this JSON file")
+    parser.add_argument("--threshold", type = float, default = .2, help = "allowed slowdown as a fraction of the baseline")
+    parser.add_argument("--noise", type = float, default = .5, help = "differences below this many ms are ignored")
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--quick", action = "store_true", help = "only the two smallest sizes of every mesh")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.noise)
+        for case, phase, before, after in regressions:
+            print("REGRESSION %s / %s: %.2fms -> %.2fms (%+.0f%%)" % (case, phase, before, after, (after / before - 1) * 100))
+        if regressions:
+            sys.exit(1)
+        print("No regressions above %.0f%%" % (args.threshold * 100))
+
+main()
@@ -0,0 +1,51 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# A stand-in for the 3D view region, so GeometryMath works in `blender --background`.
+
+import math
+from types import SimpleNamespace
+from mathutils import Matrix, Vector
+
+
+def perspective_window_matrix(width, height, fov = math.radians(50), near = .01, far = 1000):
+    f = 1 / math.tan(fov / 2)
+    return Matrix((
+        (f * height / width, 0, 0, 0),
+        (0, f, 0, 0),
+        (0, 0, (far + near) / (near - far), 2 * far * near / (near - far)),
+        (0, 0, -1, 0)))
+
+def look_at(eye, target):
+    """View matrix of a camera at eye looking at target."""
+    eye = Vector(eye)
+    rotation = (Vector(target) - eye).to_track_quat('-Z', 'Y').to_matrix().to_4x4()
+    return (Matrix.Translation(eye) @ rotation).inverted()
+
+def make_context(width = 1920, height = 1080, eye = (0, 0, 10), target = (0, 0, 0)):
+    """Object with the region and region_data attributes of a bpy context."""
+    view_matrix = look_at(eye, target)
+    window_matrix = perspective_window_matrix(width, height)
+    region = SimpleNamespace(width = width, height = height)
+    region_data = SimpleNamespace(
+        view_matrix = view_matrix,
+        window_matrix = window_matrix,
+        perspective_matrix = window_matrix @ view_matrix,
+        is_perspective = True,
+        view_perspective = 'PERSP')
+    area = SimpleNamespace(width = width, height = height, tag_redraw = lambda: None)
+    return SimpleNamespace(region = region, region_data = region_data, area = area, space_data = None)
@@ -32,8 +32,27 @@ if "bpy" in locals():
     import importlib
     importlib.reload(draw)
     Draw = draw.Draw
+    importlib.reload(geometry_core)
+    importlib.reload(view_projector)
     importlib.reload(geometry_math)
     GeometryMath = geometry_math.GeometryMath
+    importlib.reload(snap_cache)
+    SnapCache = snap_cache.SnapCache
+    importlib.reload(mesh_arrays)
+    SharedMeshArrays = mesh_arrays.SharedMeshArrays
+    importlib.reload(snap_grid)
+    SnapGrid = snap_grid.SnapGrid
+    importlib.reload(spatial_index)
+    SpatialIndex = spatial_index.SpatialIndex
+    ViewFilter = spatial_index.ViewFilter
+    importlib.reload(bvh_cache)
+    importlib.reload(element_tracker)
+    ElementTracker = element_tracker.ElementTracker
+    importlib.reload(mesh_sync)
+    MeshSync = mesh_sync.MeshSync
+    importlib.reload(native_cut)
+    NativeCut = native_cut.NativeCut
+    dissolve_redundant_edges = native_cut.dissolve_redundant_edges
     importlib.reload(preferences)
     importlib.reload(profiler)
 
@@ -41,12 +60,19 @@ if "bpy" in locals():
 else:
     from .draw import Draw
     from .geometry_math import GeometryMath
+    from .spatial_index import SpatialIndex, ViewFilter
+    from . import bvh_cache
+    from .snap_cache import SnapCache
+    from .snap_grid import SnapGrid
+    from .mesh_arrays import SharedMeshArrays
+    from .native_cut import NativeCut, dissolve_redundant_edges
+    from .element_tracker import ElementTracker
+    from .mesh_sync import MeshSync
     from . import preferences
     from . import profiler
 
 import bpy
 from bpy_extras import view3d_utils
-from mathutils.bvhtree import BVHTree
 import bmesh
 import gpu
 import numpy as np
@@ -54,12 +80,30 @@ import numpy as np
 from gpu_extras.batch import batch_for_shader
 #import time
 import mathutils
+import mathutils.kdtree
 import math
+from collections import namedtuple
 
 
+# the part of an event which calc_hit needs
+MouseMove = namedtuple("MouseMove", ["mouse_region_x", "mouse_region_y"])
+
 def calc_edge_center(edge):
     return (edge.verts[0].co + edge.verts[1].co) / 2
 
+def create_fan_mesh(name, co):
+    """Mesh with edges from the first point of N×3 co to every other one."""
+    n = len(co)
+    me = bpy.data.meshes.new(name)
+    me.vertices.add(n)
+    me.vertices.foreach_set("co", np.asarray(co, dtype = np.float32).ravel())
+    me.edges.add(n - 1)
+    edges = np.zeros((n - 1, 2), dtype = np.int32)
+    edges[:, 1] = np.arange(1, n)
+    me.edges.foreach_set("vertices", edges.ravel())
+    me.update()
+    return me
+
 def edge_to_dict(edge):
     return {"verts": [{"co": edge.verts[0].co}, {"co": edge.verts[1].co}]}
 
@@ -83,37 +127,172 @@ def is_backfacing(face, view_vector):
     normal = face.normal
     return np.dot(view_vector, normal) > 0
 
-def dissolve_redundant_edges(bm, vert, excluded_verts = []):
-    dissolved_edges = []
-    l = len(vert.link_edges)
-    for e in vert.link_edges:
-        if not e.other_vert(vert) in excluded_verts and l > 2:
-            dissolved_edges.append(e)
-            l -= 1
-    # dissolved_edges = vert.link_edges[slice(len(vert.link_edges) - 2)]
-    bmesh.ops.dissolve_edges(bm, edges = dissolved_edges, use_verts = False, use_face_split = False)
-
-class HalfKnifeOperator(bpy.types.Operator):
-    """Run half knife"""
-    bl_idname = "mesh.half_knife_operator"
-    bl_label = "Half knife"
-    bl_options = {'REGISTER', 'UNDO'}
+class EditTarget:
+    """The bmesh and the picking structures of one object in edit mode.
+
+    The structures are built by ensure() on the first hover over the object
+    and kept for the whole session. The BVH is taken from and given back to
+    bvh_cache, so the next session on an unchanged mesh starts without it.
+    """
+
+    def __init__(self, context, object):
+        self.object = object
+        self.bmesh = bmesh.from_edit_mesh(object.data)
+        self.mesh_sync = MeshSync(self.bmesh, object.data)
+        self.util = GeometryMath(context, object)
+        self.tree = None
+        # increased on every edit, keys the snap cache
+        self.mesh_generation = 0
+
+    def ensure(self, prefs, xray):
+        if self.tree:
+            return
+        # the view filter and the snap grid read the mesh arrays once between edits
+        self.mesh_arrays = SharedMeshArrays(self.bmesh)
+        view = ViewFilter(self.util.projector, self.mesh_arrays, prefs.view_bvh_margin) if prefs.use_view_bvh else None
+        self.tree = bvh_cache.get(self.object.data, self.bmesh, view) or SpatialIndex(self.bmesh, view)
+        if self.tree.view:
+            # a cached tree brings the arrays of the unchanged mesh
+            self.mesh_arrays = self.tree.view.source
+        self.snap_cache = SnapCache(self.util)
+        self.snap_grid = None
+        if prefs.use_snap_grid:
+            radius = max(prefs.snap_vertex_distance, prefs.snap_edge_distance)
+            self.snap_grid = SnapGrid(self.bmesh, self.util, self.tree, self.mesh_arrays, radius, xray = xray)
+
+    def ray_hits_bounds(self, x, y):
+        """False if the view ray through the pixel misses the bounding box, so the object can't be hit."""
+        origin, direction = self.util.get_view_object_space(x, y)
+        box = np.array(self.object.bound_box, dtype = np.float64)
+        lo, hi = box.min(axis = 0), box.max(axis = 0)
+        pad = (hi - lo).max() * 1e-3 + 1e-6
+        o = np.array(origin)
+        d = np.array(direction)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            t1 = (lo - pad - o) / d
+            t2 = (hi + pad - o) / d
+            near = np.nanmax(np.minimum(t1, t2))
+            far = np.nanmin(np.maximum(t1, t2))
+        return far >= max(near, 0)
+
+    def depth(self, hit, x, y):
+        """World space distance of an object space hit along the view ray through the pixel."""
+        origin, direction = self.util.get_view_world_space(x, y)
+        return (self.object.matrix_world @ hit - origin).dot(direction)
+
+
+class HalfKnifeCut:
+    """Cut logic of the half knife operator.
+
+    The state of a cut lives in plain attributes, so the logic also runs on
+    a plain subclass without a 3D view region, see `./benchmarks/`.
+    """
+
+    # the cut through preview samples the cut path every this many pixels, but not more than the limit
+    cut_through_preview_step = 8
+    cut_through_preview_samples = 256
+    # how far from snapped_hit the end vertex of a knife_project cut may be, relative to its distance from the origin
+    end_vertex_epsilon = 1e-4
+
+    def setup(self, context, object, prefs, objects = (), start_from_selection = True):
+        """Reads the edit mesh and builds the picking structures. Returns False if too many verts are selected.
+
+        Other objects in edit mode can be given in objects. They are picked
+        until the cut starts and occlude the cut object after it. Without
+        start_from_selection the selected verts aren't start vertices and
+        aren't limited.
+        """
+        self._cut_through = self.cut_through
+        self._angle_constraint = False
+        self._snap_to_center = self.snap_to_center
+        self._altitude_mode = self.altitude_mode
+        self._snap_to_center_alternate = self.snap_to_center_alternate
+        self._turn_off_snapping = self.turn_off_snapping
+        self._debug_keep_cut_obj = False
+        self.context = context
+        self.prefs = prefs
+        # a batch keeps one tracker for all cuts and the elements it selected
+        self.tracker = None
+        self.own_selection = None
 
-    auto_cut: bpy.props.BoolProperty(name="Cut without preview", default=False)
-    altitude_mode: bpy.props.BoolProperty(name="Altitude mode", default=False)
-    snap_to_center: bpy.props.BoolProperty(name="Snap to center", default=False)
-    snap_to_center_alternate: bpy.props.BoolProperty(name="Snap to center of end points only", default=False)
-    cut_through: bpy.props.BoolProperty(name="Cut through", default=False)
-    turn_off_snapping: bpy.props.BoolProperty(name="Turn off snapping", default=False)
+        self.targets = [EditTarget(context, object)] + [EditTarget(context, o) for o in objects if o != object]
+        self.target = None
+        start = self.targets[0]
 
-    @classmethod
-    def poll(cls, context):
-        return (context.space_data.type == 'VIEW_3D'
-            and context.object
-            and context.object.mode == 'EDIT')
+        self.initial_vertices = [v for v in start.bmesh.verts if v.select] if start_from_selection else []
+        vert_len = len(self.initial_vertices)
+        self.is_multiple_verts = vert_len > 1
+        if self.prefs.max_start_vertices and vert_len > self.prefs.max_start_vertices:
+            return False
 
+        self.set_target(start)
+
+        self.is_cut_from_new_vertex = False
+        self.virtual_start = None
+        self.last_hited_face = None
+        # set by the batch operator, the edit mesh is then flushed once at the end
+        self.defer_mesh_update = False
+        return True
+
+    def set_target(self, target):
+        """Makes the object of the target the one which is cut."""
+        if target is self.target:
+            return
+        if self.target:
+            self.target.mesh_generation = self.mesh_generation
+        target.ensure(self.prefs, self.is_xray())
+        self.target = target
+        self.object = target.object
+        self.bmesh = target.bmesh
+        self.mesh_sync = target.mesh_sync
+        self.util = target.util
+        self.tree = target.tree
+        self.snap_cache = target.snap_cache
+        self.snap_grid = target.snap_grid
+        self.mesh_arrays = target.mesh_arrays
+        self.mesh_generation = target.mesh_generation
+
+    def keep_structures(self):
+        """Gives the picking BVHs back to bvh_cache for the next session."""
+        for target in self.targets:
+            if target.tree:
+                bvh_cache.put_later(target.object.data, target.bmesh, target.tree, self.prefs.bvh_cache_size)
+
+    def ray_cast_targets(self, x, y):
+        """Ray cast of the cut object, other objects in edit mode in front of it hide the hit.
+
+        Before the cut has a start the nearest object becomes the cut object.
+        """
+        hit, face = self.util.ray_cast_BVH(self.tree, x, y)
+        if len(self.targets) < 2:
+            return hit, face
+        depth = self.target.depth(hit, x, y) if hit else float("inf")
+        nearest = None
+        for target in self.targets:
+            if target is self.target or not target.ray_hits_bounds(x, y):
+                continue
+            target.ensure(self.prefs, self.is_xray())
+            t_hit, t_face = target.util.ray_cast_BVH(target.tree, x, y)
+            if t_hit and target.depth(t_hit, x, y) < depth:
+                depth = target.depth(t_hit, x, y)
+                nearest = target, t_hit, t_face
+        if not nearest:
+            return hit, face
+        if self.initial_vertices or self.virtual_start:
+            return None, None
+        target, hit, face = nearest
+        self.set_target(target)
+        return hit, face
+
+    def hide_other_objects(self):
+        """knife_project cuts every visible object in edit mode. Returns the hidden ones."""
+        hidden = [t.object for t in self.targets if t is not self.target and not t.object.hide_get()]
+        for o in hidden:
+            o.hide_set(True)
+        return hidden
 
     def addVertOnFace(self, co, face):
+        self.tree.invalidate([face])
         vert = bmesh.ops.poke(self.bmesh, faces=[face])['verts'][0]
         vert.co = co
         dissolve_redundant_edges(self.bmesh, vert)
@@ -147,15 +326,24 @@ class HalfKnifeOperator(bpy.types.Operator):
             center = calc_edge_center(self.edge)
             vert = self.addVertOnEdge(self.snapped_hit, self.edge)
 
-        vert.select_set(True)
+        self.select([vert])
         self.bmesh.select_history.add(vert)
-        self.update_geom()
+        self.update_geom(vert.link_faces)
         return vert, center
 
-    def update_geom(self):
-        bmesh.update_edit_mesh(self.object.data, loop_triangles = True, destructive = True)
-        self.tree = BVHTree.FromBMesh(self.bmesh)
-        self.bmesh.faces.ensure_lookup_table()
+    def update_geom(self, changed_faces = None, destructive = True):
+        # changed_faces = None means that the whole mesh could be changed
+        # the edit mesh is synced later by mesh_sync.flush()
+        self.mesh_generation += 1
+        self.mesh_sync.mark(destructive)
+        if destructive or changed_faces is None:
+            self.mesh_arrays.invalidate()
+        else:
+            self.mesh_arrays.move(set([v for f in changed_faces for v in f.verts]))
+        if changed_faces is None:
+            self.tree.rebuild()
+        else:
+            self.tree.update(changed_faces)
 
     def get_drawing_edges(self, hit):
         return [{"verts": [{"co": v.co},
@@ -171,6 +359,7 @@ class HalfKnifeOperator(bpy.types.Operator):
         }
 
     def snap_vert_preivew(self, vert):
+        self.vert = vert
         self.snap_mode = 'VERT'
         self.snapped_hit = vert.co
         self.snapped_vert = vert
@@ -180,42 +369,42 @@ class HalfKnifeOperator(bpy.types.Operator):
         }
 
     def update_snap_axises(self):
+        """Builds the angle constraint axes of every face around the start vertex as arrays."""
         vert = self.initial_vertices[0]
-        v_edges = vert.link_edges
-        result = []
-        def createLine(vert_co, vector, face):
-            v = vector * 20
-            return self.util.project_point_on_view(vert_co), self.util.project_point_on_view(vert_co + vector), face, vert_co - v, vert_co + v
-        self.snap_axises_highlight = []
-        for face in vert.link_faces:
-            edges = []
-            for e in v_edges:
-                if e in face.edges:
-                    edges.append(e)
-            highlightV1 = edges[0].other_vert(vert).co
-            highlightV2 = edges[1].other_vert(vert).co
-            highlightE1 = edges[0]
-            highlightE2 = edges[1]
-            highlightFace = face
-            self.snap_axises_highlight.append((highlightFace, highlightE1, highlightE2, highlightV1, highlightV2))
-
-            v1 = highlightV1 - vert.co
-            v1.normalize()
-            v2 = highlightV2 - vert.co
-            v2.normalize()
-            v = (v1 + v2) / 2
-            if v.length < 0.001:
-                v = mathutils.Vector(np.cross(face.normal, v2))
-                v.normalize()
-
-            n45 = (v1 + v) / 2
-            p45 = (v2 + v) / 2
-            result.append(createLine(vert.co, n45, face))
-            result.append(createLine(vert.co, v, face))
-            result.append(createLine(vert.co, p45, face))
+        self.snap_axises_faces = {}
+        self.snap_axises_highlight = {}
+        ends = []
+        normals = []
+        # the loops of the vertex give the two edges of each face at once
+        for loop in vert.link_loops:
+            e1 = loop.edge
+            e2 = loop.link_loop_prev.edge
+            v1 = e1.other_vert(vert).co
+            v2 = e2.other_vert(vert).co
+            self.snap_axises_faces[loop.face] = len(ends)
+            self.snap_axises_highlight[loop.face] = (e1, e2, v1, v2)
+            ends.append((v1, v2))
+            normals.append(loop.face.normal)
         if not self.last_hited_face:
             self.last_hited_face = vert.link_faces[0]
-        self.snap_axises = result
+        self.snap_axises_co = np.array(vert.co, dtype = np.float64)
+        self.snap_axises = self.util.corner_axes(self.snap_axises_co, np.array(ends, dtype = np.float64).reshape(-1, 2, 3),
+            np.array(normals, dtype = np.float64).reshape(-1, 3), self.prefs.angle_constraint_increment)
+        # the axes on the view plane, see project_snap_axises
+        self.snap_axises_view = None
+
+    def project_snap_axises(self):
+        """Projects all axes on the view plane at once, again only after the view changes."""
+        projector = self.util.projector
+        projector.sync()
+        if self.snap_axises_view == projector.version:
+            return
+        faces, axes = self.snap_axises.shape[:2]
+        co = self.snap_axises_co
+        projected = self.util.project_points_on_view(np.vstack((co, (co + self.snap_axises).reshape(-1, 3))))
+        self.snap_axises_start = projected[0]
+        self.snap_axises_ends = projected[1:].reshape(faces, axes, 3)
+        self.snap_axises_view = projector.version
 
     def draw_angle_constraint(self, batch):
         a = self.active_axis
@@ -225,16 +414,12 @@ class HalfKnifeOperator(bpy.types.Operator):
             "verts": [{"co": a[0]}, {"co": a[1]}]
         })
         batch['edge'].insert(0, (axises, self.prefs.angle_constraint_axis))
-        highlight_data = None
-        for d in self.snap_axises_highlight:
-            if d[0] == self.last_hited_face:
-                highlight_data = d
-                break
+        highlight_data = self.snap_axises_highlight.get(self.last_hited_face)
         if highlight_data:
-            e1 = edge_to_dict(highlight_data[1])
-            e2 = edge_to_dict(highlight_data[2])
-            v1 = highlight_data[3]
-            v2 = highlight_data[4]
+            e1 = edge_to_dict(highlight_data[0])
+            e2 = edge_to_dict(highlight_data[1])
+            v1 = highlight_data[2]
+            v2 = highlight_data[3]
             batch['edge'].insert(0, ([e1, e2], self.prefs.edge_snap))
             batch['vert'].insert(0, ([v1, v2], self.prefs.vertex_snap))
         # batch['edge'].insert(0, (axises, self.prefs.angle_constraint_axis))
@@ -242,26 +427,21 @@ class HalfKnifeOperator(bpy.types.Operator):
         return batch
 
     def snap_to_axis(self, hit):
-        res_d = float("inf")
-        res_p = None
-        # start = self.util.project_point_on_view(self.initial_vertices[0].co)
-        axises = self.snap_axises
-        res_axis = None
-        for start, end, face, draw_start, draw_end in axises:
-            if face != self.last_hited_face:
-                continue
-            p = self.util.vertex_project(hit, start, end)
-            d = (hit - p).length
-            if d < res_d:
-                res_d = d
-                res_p = p
-                res_axis = (draw_start, draw_end)
-        return res_p, res_axis
+        """Projects the hit on the nearest axis of the hovered face. Returns the point and the ends of the axis to draw."""
+        i = self.snap_axises_faces.get(self.last_hited_face)
+        if i is None:
+            return None, None
+        self.project_snap_axises()
+        ends = self.snap_axises_ends[i]
+        axis, projected = self.util.nearest_line(hit, np.broadcast_to(self.snap_axises_start, ends.shape), ends)
+        co = self.snap_axises_co
+        v = self.snap_axises[i, axis] * 20
+        return mathutils.Vector(projected), (mathutils.Vector(co - v), mathutils.Vector(co + v))
 
     def snap_face_preivew(self, hit, face):
         self.snap_mode = 'FACE'
         if self._snap_to_center and not self._turn_off_snapping:
-            self.snapped_hit = face.calc_center_median()
+            self.snapped_hit = self.snap_cache.get(face, self.mesh_generation).center.copy()
         else:
             self.snapped_hit = hit
         return {
@@ -272,8 +452,11 @@ class HalfKnifeOperator(bpy.types.Operator):
 
     def snap_edge_preivew(self, hit, edge, projected):
         self.snap_mode = 'EDGE'
+        self.edge = edge
         if self._snap_to_center and not self._turn_off_snapping:
-            projected = calc_edge_center(edge)
+            snap_data = self.snap_cache.get(self.face, self.mesh_generation) if self.face else None
+            # an edge from the snap grid may not belong to the face under the cursor
+            projected = snap_data.edge_center(edge) if snap_data and edge in snap_data.edge_index else calc_edge_center(edge)
         self.snapped_hit = projected
         edge_draw = []
         if self._altitude_mode:
@@ -285,81 +468,167 @@ class HalfKnifeOperator(bpy.types.Operator):
             'vert': [([projected], self.prefs.vertex)]
         }
 
-    def select_edges(self):
-        for start, end in self.selection_path:
-            bpy.ops.view3d.select_circle(x = int(start.x), y = int(start.y), radius = 2, wait_for_input = False, mode = 'ADD')
-            bpy.ops.view3d.select_circle(x = int(end.x), y = int(end.y), radius = 2, wait_for_input = False, mode = 'ADD')
-
-    def select_path(self, only_ends = False, mode = 'ADD'):
-        for start, end in self.selection_path:
-            if only_ends:
-                bpy.ops.view3d.select_circle(x = int(start.x), y = int(start.y), radius = 2, wait_for_input = False, mode = mode)
-                bpy.ops.view3d.select_circle(x = int(end.x), y = int(end.y), radius = 2, wait_for_input = False, mode = mode)
-            else:
-                se = end - start
-                step_size = 4
-                l = int(se.length / step_size)
-                range_start = 0
-                range_end = l + 1
-                path = []
-                for i in range(range_start, range_end):
-                    p = start + (i / l) * se
-                    path.append([int(p.x), int(p.y)])
-                if l == 0:
-                    bpy.ops.view3d.select_circle(x = int(start.x), y = int(start.y), radius = 2, wait_for_input = False, mode = mode)
-                    return
-
-                #bpy.ops.view3d.select_lasso(path = path, mode = mode)
-                for x, y in path:
-                    bpy.ops.view3d.select_circle(x = x, y = y, radius = 2, wait_for_input = False, mode = mode)
-
-
-    def get_cut_point(self, coord):
-        screen_position_px = self.util.location_3d_to_region_2d_object_space(coord)
-        view_origin, view_vector = self.util.get_view_world_space(screen_position_px.x, screen_position_px.y)
-        pos = view_origin + view_vector;
-        return pos, screen_position_px
-
-    def create_cut_obj(self):
-        # Make a new BMesh
-        bm = bmesh.new()
-        new_vertex_co = self.snapped_hit
-
-        self.selection_path = []
+    def find_grid_vert(self, event):
+        if not self.snap_grid or self._turn_off_snapping:
+            return None
+        with profiler.latency.phase("Closest element"):
+            self.snap_grid.ensure()
+            excluded = [self.virtual_start] if self.virtual_start else []
+            return self.snap_grid.find_vert(event.mouse_region_x, event.mouse_region_y, self.prefs.snap_vertex_distance, excluded)
+
+    def find_grid_edge(self, event):
+        if not self.snap_grid or self._turn_off_snapping:
+            return None, None
+        with profiler.latency.phase("Closest element"):
+            self.snap_grid.ensure()
+            return self.snap_grid.find_edge(event.mouse_region_x, event.mouse_region_y, self.prefs.snap_edge_distance)
+
+    def is_xray(self):
+        space = self.context.space_data
+        if not space or space.type != 'VIEW_3D':
+            return False
+        shading = space.shading
+        return shading.show_xray_wireframe if shading.type == 'WIREFRAME' else shading.show_xray
+
+    def project_verts(self, verts):
+        co = np.fromiter((c for v in verts for c in v.co), dtype = np.float64, count = len(verts) * 3)
+        return co.reshape(-1, 3), self.util.project_array(co)
+
+    def edges_near_points(self, points, radius):
+        # the edges around the faces hit at and around the points, the rest of the mesh is never visited
+        limit = 0 if self.is_xray() else 1
+        faces = set()
+        for x, y in points:
+            for dx, dy in ((0, 0), (-radius, -radius), (radius, -radius), (-radius, radius), (radius, radius)):
+                origin, direction = self.util.get_view_object_space(x + dx, y + dy)
+                faces.update(hit[2] for hit in self.tree.ray_cast_all(origin, direction, limit))
+        verts = set(v for f in faces for v in f.verts)
+        verts.update(self.initial_vertices)
+        return list(set(e for v in verts for e in v.link_edges if not e.hide))
+
+    def select_edges(self, radius = 2):
+        # works like select_circle at both ends of every path segment in the edge select mode
+        bm = self.bmesh
+        points = np.unique(np.array([p for segment in self.selection_path for p in segment], dtype = np.float64).reshape(-1, 2), axis = 0)
+        edges = self.edges_near_points(points, radius)
+        if not edges:
+            return []
+        verts = list(set(v for e in edges for v in e.verts))
+        vert_indices = {v: i for i, v in enumerate(verts)}
+        co, px = self.project_verts(verts)
+        indices = np.fromiter((vert_indices[v] for e in edges for v in e.verts), dtype = np.int64, count = len(edges) * 2)
+        a = px[indices[0::2]]
+        b = px[indices[1::2]]
+        xray = self.is_xray()
+        selected = []
+        point_indices, edge_indices, t = self.util.points_near_segments_2d(points, a, b, radius)
+        for i, fac in zip(edge_indices, t):
+            e = edges[i]
+            if e.select:
+                continue
+            v1, v2 = e.verts
+            if xray or self.util.is_visible(self.tree, v1.co.lerp(v2.co, fac)):
+                e.select_set(True)
+                selected.append(e)
+        bm.select_flush_mode()
+        return selected
+
+    def select_path(self, only_ends = False, mode = 'ADD', radius = 2):
+        # works like select_circle along every path segment (or at its ends) in the vertex select mode
+        # returns the visible verts on the path which are in the requested selection state
+        bm = self.bmesh
+        verts = [v for v in bm.verts if not v.hide]
+        if not verts:
+            return []
+        co, px = self.project_verts(verts)
+        select = mode == 'ADD'
+        xray = self.is_xray()
+        path = np.array(self.selection_path, dtype = np.float64).reshape(-1, 2, 2)
+        if only_ends:
+            ends = np.unique(path.reshape(-1, 2), axis = 0)
+            path = np.stack((ends, ends), axis = 1)
+        point_indices, segment_indices, t = self.util.points_near_segments_2d(px, path[:, 0], path[:, 1], radius)
+        near = np.zeros(len(verts), dtype = bool)
+        near[point_indices] = True
+        result = []
+        for i in np.flatnonzero(near):
+            v = verts[i]
+            if v.select == select:
+                result.append(v)
+            elif xray or self.util.is_visible(self.tree, v.co):
+                v.select_set(select)
+                result.append(v)
+        bm.select_flush_mode()
+        return result
+
+
+    def cast_cut_path(self, step, limit = 0, max_samples = 0):
+        """Hits of every surface under the cut path sampled every step pixels. Returns sample hit lists per segment."""
+        px = self.util.project_array([self.snapped_hit] + self.get_cut_starts())
+        end = px[0]
+        starts = [p for p in px[1:] if not np.isnan(p).any()]
+        if np.isnan(end).any() or not starts:
+            return []
+        lengths = [np.linalg.norm(end - p) for p in starts]
+        if max_samples:
+            step = max(step, sum(lengths) / max_samples)
+        paths = []
+        for start, length in zip(starts, lengths):
+            t = np.linspace(0, 1, int(length / step) + 2)
+            samples = start + (end - start) * t[:, None]
+            paths.append([self.tree.ray_cast_all(*self.util.get_view_object_space(x, y), limit) for x, y in samples])
+        return paths
+
+    def draw_cut_through(self, batch):
+        # the cut on every surface which gets cut, layers are matched by their depth order
+        edges = []
+        ends = []
+        for path in self.cast_cut_path(self.cut_through_preview_step, self.prefs.cut_through_layers, self.cut_through_preview_samples):
+            for a, b in zip(path, path[1:]):
+                for hit_a, hit_b in zip(a, b):
+                    edges.append({"verts": [{"co": hit_a[0]}, {"co": hit_b[0]}]})
+            ends.extend([hit[0] for hit in path[-1]])
+        batch['edge'].append((edges, self.prefs.cutting_edge))
+        batch['vert'].append((ends, self.prefs.vertex))
+        return batch
 
-        v0co, end_px = self.get_cut_point(new_vertex_co)
-        v0 = bm.verts.new(v0co)
+    def hide_deep_layers(self):
+        """Hides the faces under the cut path behind the first cut_through_layers surfaces. Returns them."""
+        layers = self.prefs.cut_through_layers
+        cut = set()
+        deep = set()
+        for path in self.cast_cut_path(1):
+            for hits in path:
+                for i, hit in enumerate(hits):
+                    (cut if i < layers else deep).add(hit[2])
+        # small faces between the samples
+        deep.update([f for face in list(deep) for v in face.verts for f in v.link_faces])
+        hidden = [f for f in deep - cut if not f.hide]
+        for f in hidden:
+            f.hide_set(True)
+        self.mesh_sync.mark(destructive = False)
+        return hidden
+
+    def get_cut_starts(self):
+        # object space start points of the cut segments, every segment ends in snapped_hit
         if self._altitude_mode and self._altitude_prolong_edge:
+            new_vertex_co = self.snapped_hit
             v1e, v2e = [v.co for v in self.edge.verts]
             d1 = (v1e - new_vertex_co).length
             d2 = (v2e - new_vertex_co).length
             v = v1e if d1 < d2 else v2e
+            return [v, self.initial_vertices[0].co]
+        return [v.co for v in self.initial_vertices]
 
-            v1co, px1 = self.get_cut_point(v)
-            v1 = bm.verts.new(v1co)
-            edge1 = bm.edges.new((v0, v1))
-            self.selection_path.append((px1, end_px))
-
-            v2co, px2 = self.get_cut_point(self.initial_vertices[0].co)
-            v2 = bm.verts.new(v2co)
-            edge2 = bm.edges.new((v0, v2))
-            self.selection_path.append((px2, end_px))
-
-
-        else:
-            # v0.select_set(True)
-            for v in self.initial_vertices:
-                # v.select_set(False)
-                v1co, px = self.get_cut_point(v.co);
-                v1 = bm.verts.new(v1co)
-                # v1.select_set(True)
-                edge = bm.edges.new((v0, v1))
-                self.selection_path.append((px, end_px))
-
-        me = bpy.data.meshes.new("Mesh")
-        bm.to_mesh(me)
-        bm.free()
+    def calc_selection_path(self):
+        px = self.util.project_array([self.snapped_hit] + self.get_cut_starts())
+        self.selection_path = [(start_px, px[0]) for start_px in px[1:]]
 
+    def create_cut_obj(self):
+        # all points of the cut are projected at once, the end point goes first
+        co, px = self.util.get_cut_points([self.snapped_hit] + self.get_cut_starts())
+        self.selection_path = [(start_px, px[0]) for start_px in px[1:]]
+        me = create_fan_mesh("Mesh", co)
 
         # Add the mesh to the scene
         obj = bpy.data.objects.new("Cut object", me)
@@ -373,32 +642,31 @@ class HalfKnifeOperator(bpy.types.Operator):
     def delete_vitrual_vertex(self):
         if self.virtual_start:
             bmesh.ops.delete(self.bmesh, geom = [self.virtual_start], context = 'VERTS')
-            self.update_geom()
+            self.update_geom([])
 
-    def fix_lonely_vert(self, start_co):
+    def fix_lonely_vert(self, start_key):
         bm = self.bmesh = bmesh.from_edit_mesh(self.object.data)
 
-        start = None
-        lonely_vert = None
-        for v in bm.verts:
-            if v.co == start_co:
-                start = v
-            if v.select:
-                lonely_vert = v
-        if not lonely_vert:
+        start = self.tracker.get(start_key)
+        if not self.tracker.is_known(start):
+            start = None
+        # the end vertex is selected after the cut
+        lonely_vert = bm.select_history.active
+        if not isinstance(lonely_vert, bmesh.types.BMVert) or not lonely_vert.select:
             return
         if len(lonely_vert.link_faces) != 0:
             return
         end = lonely_vert.co
         bm.verts.remove(lonely_vert)
-        self.update_geom()
-        hit, face = self.util.ray_cast_point(self.tree, bm, self.snapped_hit)
+        self.update_geom([])
+        hit, face = self.util.ray_cast_point(self.tree, self.snapped_hit)
+        self.tree.invalidate([face])
         vert = bmesh.ops.poke(bm, faces=[face])['verts'][0]
         vert.co = self.snapped_hit
         dissolve_redundant_edges(bm, vert, excluded_verts = [start])
-        vert.select_set(True)
+        self.select([vert])
         self.bmesh.select_history.add(vert)
-        self.update_geom()
+        self.update_geom(vert.link_faces)
 
     def fix_broken_edges(self):
         verts = list(self.initial_vertices)
@@ -413,15 +681,18 @@ class HalfKnifeOperator(bpy.types.Operator):
         bpy.ops.mesh.select_mode(use_extend = False, use_expand = False, type = 'EDGE')
         profiler.lap('Switching mode')
 
-        self.select_edges()
+        select_edges = self.select_edges()
+        # edges between the selected verts become selected after switching the mode
+        select_edges.extend(set([e for v in self.initial_vertices for e in v.link_edges if e.select]) - set(select_edges))
         profiler.lap('Selecting edges')
 
-        select_edges = list([e for e in bm.edges if e.select])
         broken_edges = []
+        if select_edges:
+            ends = np.array([v.co for e in select_edges for v in e.verts], dtype = np.float32).reshape(-1, 2, 3)
+            points = np.array([v.co for v in verts], dtype = np.float32)
+            edge_indices, vert_indices = self.util.points_on_edges(points, ends[:, 0], ends[:, 1], fix_dist)
+            broken_edges = [(select_edges[i], verts[j]) for i, j in zip(edge_indices, vert_indices)]
         for e in select_edges:
-            for v in verts:
-                if self.util.is_point_on_edge(v.co, e.verts[0].co, e.verts[1].co, fix_dist):
-                    broken_edges.append((e, v))
             e.verts[0].select = e.verts[1].select = e.select = False
         profiler.lap('Sorting edges')
 
@@ -429,6 +700,16 @@ class HalfKnifeOperator(bpy.types.Operator):
         profiler.lap('Switching mode')
         for v in self.initial_vertices:
             v.select = True
+
+        # welding may recreate faces, so the BVH is patched around verts which survive it
+        touched_faces = set()
+        for e, v in broken_edges:
+            touched_faces.update(e.link_faces)
+            touched_faces.update(v.link_faces)
+        self.tree.invalidate(touched_faces)
+        merged = set([v for e, v in broken_edges])
+        anchors = set([v for f in touched_faces for v in f.verts if not v in merged])
+
         verts_to_merge = []
         for e, v in broken_edges:
             #split_ratio = self.util.get_split_ratio(v.co, e)
@@ -442,20 +723,102 @@ class HalfKnifeOperator(bpy.types.Operator):
         bmesh.ops.remove_doubles(bm, verts = verts_to_merge, dist = fix_dist)
         profiler.lap('Welding')
 
-        selected_verts = [v for v in bm.verts if v.select]
-        for v in selected_verts:
+        # only the selected verts survive welding or take the place of a welded one
+        selected_verts = [v for v in self.initial_vertices if not v in merged]
+        selected_verts.extend(set([v for a in anchors for e in a.link_edges for v in e.verts if v.select and not v in anchors]) - set(selected_verts))
+        for v in list(selected_verts):
             if (v.co - self.snapped_hit).length < fix_dist:
                 v.select = False
                 selected_verts.remove(v)
         profiler.lap('Selecting')
 
         self.initial_vertices = selected_verts
-        self.update_geom()
+        self.update_geom(set([f for v in anchors for f in v.link_faces]))
         profiler.lap('Update geom')
 
 
 
+    def find_cut_end_vertex(self):
+        # the cut ends at snapped_hit in the snapped vert or in a vert created by the cut
+        end = self.snapped_hit
+        epsilon = self.end_vertex_epsilon * max(end.length, 1)
+        if self.snap_mode == 'VERT' and self.snapped_vert.is_valid and (self.snapped_vert.co - end).length <= epsilon:
+            return self.snapped_vert
+        # the faces around the end in 3D, occluded ones or ones at the silhouette too
+        verts = set(v for f in self.tree.find_nearest_range(end, epsilon) for v in f.verts)
+        # a cut ending inside a face leaves its end on a wire edge
+        starts = [v for v in self.initial_vertices if v.is_valid]
+        verts.update(e.other_vert(v) for v in list(verts) + starts for e in v.link_edges if e.is_wire)
+        candidates = [v for v in verts if not self.tracker.is_known(v) and (v.co - end).length <= epsilon]
+        if candidates:
+            return min(candidates, key = lambda v: (v.co - end).length)
+        # knife_project may put the end farther on big or distant meshes, the nearest new vert in view is taken then
+        new_verts = self.tracker.new_verts()
+        if not new_verts:
+            return None
+        kd = mathutils.kdtree.KDTree(len(new_verts))
+        for i, v in enumerate(new_verts):
+            kd.insert(v.co, i)
+        kd.balance()
+        co, index, distance = kd.find(end)
+        if index is None or self.util.distance_2d(co, end) > self.prefs.snap_vertex_distance:
+            return None
+        return new_verts[index]
+
+    def get_cut_engine(self):
+        engine = self.cut_engine
+        if engine == 'PREFERENCES':
+            engine = self.prefs.cut_engine
+        # the native engine cuts only the visible surface from a real start vertex
+        if self._cut_through or self.virtual_start or (self._altitude_mode and self._altitude_prolong_edge):
+            return 'KNIFE_PROJECT'
+        return engine
+
+    def run_native_cut(self, full_snap_mode):
+        """Returns False if nothing could be cut, knife_project is tried then."""
+        cut = NativeCut(self.bmesh, self.util, self.tree, snap_to_center = full_snap_mode)
+        end_vert = None
+        for v in self.initial_vertices:
+            first = len(cut.path_verts)
+            end_vert = cut.cut(v, self.snapped_hit) or end_vert
+            # the next cuts resolve their target in the tree
+            self.tree.update(cut.changed_faces(first))
+        if not end_vert and not cut.edits:
+            return False
+        if end_vert:
+            self.select_only([end_vert])
+            self.bmesh.select_history.add(end_vert)
+        self.update_geom([])
+        if cut.missed:
+            self.warn("The cut from %d of %d vertices didn't reach the end point" % (cut.missed, len(self.initial_vertices)))
+        return True
+
+    def warn(self, message):
+        """Reports a warning of the operator, the headless subclasses print it."""
+        report = getattr(self, "report", None)
+        if report:
+            report({'WARNING'}, message)
+        else:
+            print(message)
+
     def run_cut(self):
+        # adding the layer reallocates the data of every vert, a batch adds it once
+        own_tracker = self.tracker is None
+        if own_tracker:
+            self.tracker = ElementTracker(self.bmesh)
+        profiler.start()
+        try:
+            self.cut()
+        finally:
+            # the layer of the tracker must not get into the mesh
+            if own_tracker:
+                self.tracker.remove()
+                self.tracker = None
+            if not self.defer_mesh_update:
+                self.mesh_sync.flush()
+            profiler.finish()
+
+    def cut(self):
 #        v = self.bmesh.verts.new()
 #        v.co = self.new_vert
         # if not self.hit:
@@ -463,18 +826,21 @@ class HalfKnifeOperator(bpy.types.Operator):
             
         is_multiple_verts = len(self.initial_vertices) > 1
         full_snap_mode = self._snap_to_center and not is_multiple_verts and not self._snap_to_center_alternate
-        profiler.start()
+        use_native_cut = self.get_cut_engine() == 'BMESH'
         if self.snap_mode == 'EDGE':
             self.addVertOnEdge(self.snapped_hit, self.edge)
-            self.update_geom()
+            self.update_geom([])
             profiler.lap("Adding vert for edge bug fix")
 
-        self.create_cut_obj()
-        profiler.lap("Creating cut object")
+        if use_native_cut:
+            self.calc_selection_path()
+        else:
+            self.create_cut_obj()
+            profiler.lap("Creating cut object")
 
         if self.prefs.use_edge_autofix and not self.virtual_start: #TODO: make better condition. With virtual start broken edge on the end point will not be fixed.
-            self.fix_broken_edges()
-            profiler.lap("Edges fixing")
+            with profiler.scope("Edges fixing"):
+                self.fix_broken_edges()
 
         if not self.initial_vertices:
             return
@@ -487,11 +853,12 @@ class HalfKnifeOperator(bpy.types.Operator):
             end = self.snapped_hit
             if start.co == end:
                 self.delete_vitrual_vertex()
-                bpy.data.objects.remove(self.cut_obj, do_unlink=True)
+                if not use_native_cut:
+                    bpy.data.objects.remove(self.cut_obj, do_unlink=True)
                 return
             if self.snap_mode == 'FACE' and self.face in start.link_faces:
                 risk_of_lonely_vert = True
-                start_co = start.co
+                start_key = self.tracker.key(start)
 
 
 
@@ -499,17 +866,40 @@ class HalfKnifeOperator(bpy.types.Operator):
         self.delete_vitrual_vertex()
         profiler.lap("Virtual vertex")
 
-        if full_snap_mode:
+        if use_native_cut:
+            if self.run_native_cut(full_snap_mode):
+                profiler.lap("Native cut")
+                return
+            # the walk couldn't leave the start vertex, knife_project may get across
+            self.create_cut_obj()
+            profiler.lap("Native cut missed, creating cut object")
+
+        # knife_project and the selection passes below overwrite the selection, a batch puts it back
+        saved_selection = self.save_selection() if self.own_selection is not None else None
 
-            self.select_path()
+        if full_snap_mode:
 
-            old_verts = [v for v in self.bmesh.verts if v.select]
-            old_verts_coords = [v.co for v in old_verts]
+            self.tracker.mark(self.select_path())
             profiler.lap("Full snap. Saving verts before cut")
 
+        hidden = []
+        if self._cut_through and self.prefs.cut_through_layers:
+            hidden = self.hide_deep_layers()
+            profiler.lap("Hiding deep layers")
+
+        # knife_project reads the loop triangles of the edit mesh
+        self.mesh_sync.flush()
         self.cut_obj.select_set(True)
-        bpy.ops.mesh.knife_project(cut_through = self._cut_through)
+        hidden_objects = self.hide_other_objects()
+        try:
+            bpy.ops.mesh.knife_project(cut_through = self._cut_through)
+        finally:
+            for o in hidden_objects:
+                o.hide_set(False)
         profiler.lap("Knife project")
+        for f in hidden:
+            if f.is_valid:
+                f.hide_set(False)
 
         bpy.ops.mesh.select_mode(use_extend = False, use_expand = False, type = 'VERT')
 
@@ -517,21 +907,11 @@ class HalfKnifeOperator(bpy.types.Operator):
             bpy.data.objects.remove(self.cut_obj, do_unlink=True)
             profiler.lap("Removing cut object")
 
-        def compareVectorsApprox(v1, v2, delta = 0.001):
-            d = v1 - v2
-            return abs(d.x) < delta and abs(d.y) < delta and abs(d.z) < delta
-        def coord_in_list(co, list):
-            for c in list:
-                if compareVectorsApprox(c, co):
-                    return True
-            return False
         # # bpy.ops.mesh.select_all(action = 'DESELECT')
         if full_snap_mode:
-            bm = self.bmesh
-            self.select_path()
-            new_verts = [v for v in bm.verts if v.select]
+            new_verts = set(self.select_path())
             self.select_path(only_ends = True, mode = 'SUB')
-            active_verts = [v for v in new_verts if v.select and not coord_in_list(v.co, old_verts_coords)]
+            active_verts = [v for v in new_verts if v.select and not self.tracker.is_known(v)]
 
             for v in active_verts:
                 edges = []
@@ -547,26 +927,56 @@ class HalfKnifeOperator(bpy.types.Operator):
 
             profiler.lap("Snap to center edges fixing")
 
+        if saved_selection:
+            self.restore_selection(saved_selection)
+            profiler.lap("Restoring selection")
+
         self.update_geom()
         profiler.lap("Bmesh update")
 
-        select_location = self.util.location_3d_to_region_2d_object_space(self.snapped_hit)
-        if select_location:
-            bpy.ops.view3d.select(location = (int(select_location.x), int(select_location.y)))
-            # Blender 2.91 hack bugfix
-            #bpy.ops.object.mode_set(mode = 'OBJECT')
-            #bpy.ops.object.mode_set(mode = 'EDIT')
+        end_vert = self.find_cut_end_vertex()
+        if end_vert:
+            self.select_only([end_vert])
+            self.bmesh.select_history.add(end_vert)
         profiler.lap("Selecting")
 
         if risk_of_lonely_vert:
-            self.fix_lonely_vert(start_co)
+            self.fix_lonely_vert(start_key)
             profiler.lap("Lonely vert fixing")
 
-        profiler.finish()
-
     def select_only(self, bmesh_geom):
+        if self.own_selection is None:
+            bpy.ops.mesh.select_all(action = 'DESELECT')
+        else:
+            # a batch leaves the selection of the user alone
+            for e in self.own_selection:
+                if e.is_valid:
+                    e.select_set(False)
+                    self.bmesh.select_history.discard(e)
+            self.own_selection.clear()
+        self.select(bmesh_geom)
+
+    def save_selection(self):
+        bm = self.bmesh
+        elements = [e for seq in (bm.verts, bm.edges, bm.faces) for e in seq if e.select]
+        return tuple(self.context.tool_settings.mesh_select_mode), elements, list(bm.select_history)
+
+    def restore_selection(self, saved):
+        select_mode, elements, history = saved
         bpy.ops.mesh.select_all(action = 'DESELECT')
+        self.context.tool_settings.mesh_select_mode = select_mode
+        for e in elements:
+            if e.is_valid:
+                e.select_set(True)
+        self.bmesh.select_history.clear()
+        for e in history:
+            if e.is_valid:
+                self.bmesh.select_history.add(e)
+
+    def select(self, bmesh_geom):
         for e in bmesh_geom:
+            if self.own_selection is not None and not e.select:
+                self.own_selection.add(e)
             e.select_set(True)
 
     def calc_hit(self, context, event):
@@ -574,12 +984,15 @@ class HalfKnifeOperator(bpy.types.Operator):
         hit = None
         # try:
         if not self._angle_constraint:
-            hit, face = self.util.ray_cast_BVH(self.tree, self.bmesh, event.mouse_region_x, event.mouse_region_y)
+            with profiler.latency.phase("Ray cast"):
+                hit, face = self.ray_cast_targets(event.mouse_region_x, event.mouse_region_y)
             # except:
                 # hit = None
             self.hit = hit
         if hit:
-            vert, edge, vertex_pixel_distance, edge_pixel_distance, projected = self.util.find_closest(hit, face, True)
+            with profiler.latency.phase("Closest element"):
+                snap_data = self.snap_cache.get(face, self.mesh_generation)
+                vert, edge, vertex_pixel_distance, edge_pixel_distance, projected = self.util.find_closest_vectorized(hit, snap_data, True)
             self.vert = vert
             self.edge = edge
             self.face = face
@@ -591,15 +1004,38 @@ class HalfKnifeOperator(bpy.types.Operator):
                 batch = self.snap_edge_preivew(hit, edge, projected);
             elif vertex_pixel_distance < self.prefs.snap_vertex_distance and not self._turn_off_snapping:
                 batch = self.snap_vert_preivew(vert)
-            elif edge_pixel_distance < self.prefs.snap_edge_distance and not self._turn_off_snapping:
-                batch = self.snap_edge_preivew(hit, edge, projected)
             else:
-                batch = self.snap_face_preivew(hit, face)
+                # verts and edges of the neighbouring faces
+                grid_vert = self.find_grid_vert(event)
+                grid_edge, grid_projected = None, None
+                if not grid_vert and not edge_pixel_distance < self.prefs.snap_edge_distance:
+                    grid_edge, grid_projected = self.find_grid_edge(event)
+                if grid_vert:
+                    batch = self.snap_vert_preivew(grid_vert)
+                elif edge_pixel_distance < self.prefs.snap_edge_distance and not self._turn_off_snapping:
+                    batch = self.snap_edge_preivew(hit, edge, projected)
+                elif grid_edge:
+                    batch = self.snap_edge_preivew(hit, grid_edge, grid_projected)
+                else:
+                    batch = self.snap_face_preivew(hit, face)
         else:
+            grid_vert, grid_edge = None, None
+            if not self._angle_constraint:
+                # the cursor is off the mesh, but it may be close to the silhouette
+                grid_vert = self.find_grid_vert(event)
+                if not grid_vert:
+                    grid_edge, grid_projected = self.find_grid_edge(event)
+            if grid_vert or grid_edge:
+                self.face = None
+                if grid_vert:
+                    return self.snap_vert_preivew(grid_vert)
+                return self.snap_edge_preivew(grid_projected, grid_edge, grid_projected)
+
             hit = self.util.get_viewport_point_object_space(event.mouse_region_x, event.mouse_region_y)
 
             if self._angle_constraint:
-                geometry_hit, face = self.util.ray_cast_BVH(self.tree, self.bmesh, event.mouse_region_x, event.mouse_region_y)
+                with profiler.latency.phase("Ray cast"):
+                    geometry_hit, face = self.util.ray_cast_BVH(self.tree, event.mouse_region_x, event.mouse_region_y)
                 vert = self.initial_vertices[0]
                 if geometry_hit and face in vert.link_faces:
                     self.last_hited_face = face
@@ -608,6 +1044,31 @@ class HalfKnifeOperator(bpy.types.Operator):
             batch = self.snap_void_preivew(hit)
         return batch
 
+class HalfKnifeOperator(HalfKnifeCut, bpy.types.Operator):
+    """Run half knife"""
+    bl_idname = "mesh.half_knife_operator"
+    bl_label = "Half knife"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    auto_cut: bpy.props.BoolProperty(name="Cut without preview", default=False)
+    altitude_mode: bpy.props.BoolProperty(name="Altitude mode", default=False)
+    snap_to_center: bpy.props.BoolProperty(name="Snap to center", default=False)
+    snap_to_center_alternate: bpy.props.BoolProperty(name="Snap to center of end points only", default=False)
+    cut_through: bpy.props.BoolProperty(name="Cut through", default=False)
+    turn_off_snapping: bpy.props.BoolProperty(name="Turn off snapping", default=False)
+    cut_engine: bpy.props.EnumProperty(name="Cut engine",
+        items = [("PREFERENCES", "From preferences", "Use the engine chosen in the addon preferences"),
+            ("KNIFE_PROJECT", "Knife project", "Project a temporary cut object with the knife project operator"),
+            ("BMESH", "Native bmesh", "Split crossed faces directly in the edit mesh"),],
+        default="PREFERENCES")
+
+    @classmethod
+    def poll(cls, context):
+        return (context.space_data.type == 'VIEW_3D'
+            and context.object
+            and context.object.mode == 'EDIT')
+
+
     def draw_helper_text(self):
         shift = "On" if self._turn_off_snapping else "Off"
         snap_to_center = "On" if self._snap_to_center else "Off"
@@ -627,6 +1088,8 @@ class HalfKnifeOperator(bpy.types.Operator):
             altitude_mode_text = ""
 
         cut_through = "On" if self._cut_through else "Off"
+        if self._cut_through and self.prefs.cut_through_layers:
+            cut_through += ", " + str(self.prefs.cut_through_layers) + " layers"
         self.context.area.header_text_set("Shift: snapping (" + shift + ");" + snap_to_center_text + angle_constraint_text + snap_to_center_alternate_text + " Z: cut through: (" + cut_through + ")" + altitude_mode_text)
 
     def clear_helper_text(self):
@@ -635,25 +1098,47 @@ class HalfKnifeOperator(bpy.types.Operator):
     def update_initial_vertex_position(self):
         vert = self.initial_vertices[0]
         vert.co = self.inital_centered_hit if self._snap_to_center else self.initial_hit
-        self.update_geom()
+        self.tree.invalidate(vert.link_faces)
+        self.update_geom(vert.link_faces, destructive = False)
+        self.mesh_sync.flush()
         self.update_snap_axises()
 
     def redraw(self, context, event):
-        batch = None
-        try:
-            batch = self.calc_hit(context, event)
-        except Exception as e:
-            self.draw.clear()
-            raise e
-
-        if batch:
-            if self._angle_constraint:
-                batch = self.draw_angle_constraint(batch)
-
-            self.draw.batch(batch)
-        else:
-            self.draw.clear()
-        self.draw.redraw()
+        with profiler.latency.event("Mouse move"):
+            batch = None
+            try:
+                batch = self.calc_hit(context, event)
+            except Exception as e:
+                self.draw.clear()
+                raise e
+
+            if batch and self._cut_through:
+                with profiler.latency.phase("Cut through preview"):
+                    batch = self.draw_cut_through(batch)
+            with profiler.latency.phase("Batch building"):
+                if batch:
+                    if self._angle_constraint:
+                        batch = self.draw_angle_constraint(batch)
+
+                    changed = self.draw.batch(batch)
+                else:
+                    changed = self.draw.clear()
+        # the viewport redraw is expensive on dense scenes
+        if changed:
+            self.draw.redraw()
+
+    def finish_modal(self, context):
+        self.draw.draw_end()
+        self.clear_helper_text()
+        if self._timer:
+            context.window_manager.event_timer_remove(self._timer)
+            self._timer = None
+        if not self.prefs.disable_knife_icon:
+            context.window.cursor_modal_restore()
+        profiler.print_counters()
+        profiler.latency.summary()
+        profiler.report(bpy.path.abspath(self.prefs.profiler_trace_path))
+        self.keep_structures()
 
     def modal(self, context, event):
         # self._shift = event.shift
@@ -700,21 +1185,30 @@ class HalfKnifeOperator(bpy.types.Operator):
         elif event.type in {'LEFT_SHIFT', 'RIGHT_SHIFT'} and event.value == 'PRESS':
             self._turn_off_snapping = not self._turn_off_snapping
         elif event.type == 'MOUSEMOVE':
-            self.redraw(context, event)
+            profiler.count("Mouse moves received")
+            if not self._timer:
+                self.redraw(context, event)
+                profiler.count("Mouse moves evaluated")
+                return {'RUNNING_MODAL'}
+            # evaluated on the next timer tick, only the latest position matters
+            self.pending_move = MouseMove(event.mouse_region_x, event.mouse_region_y)
+            return {'RUNNING_MODAL'}
+        elif event.type == 'TIMER':
+            if self.pending_move:
+                self.redraw(context, self.pending_move)
+                self.pending_move = None
+                profiler.count("Mouse moves evaluated")
+            return {'RUNNING_MODAL'}
 
         elif event.type in {'RIGHTMOUSE', 'ESC'}:
-            self.draw.draw_end()
-            self.clear_helper_text()
+            self.finish_modal(context)
             self.delete_vitrual_vertex()
-            if not self.prefs.disable_knife_icon:
-                context.window.cursor_modal_restore()
+            self.mesh_sync.flush()
             return {'CANCELLED'}
         elif event.type in {'LEFTMOUSE'}:
+            # the click position may be newer than the last evaluated move
             self.calc_hit(context, event)
-            self.draw.draw_end()
-            self.clear_helper_text()
-            if not self.prefs.disable_knife_icon:
-                context.window.cursor_modal_restore()
+            self.finish_modal(context)
             self.run_cut()
             return {'FINISHED'}
 
@@ -722,36 +1216,25 @@ class HalfKnifeOperator(bpy.types.Operator):
         return {'RUNNING_MODAL'}
 
     def invoke(self, context, event):
-        self._cut_through = self.cut_through
-        self._angle_constraint = False
-        self._snap_to_center = self.snap_to_center
-        self._altitude_mode = self.altitude_mode
-        self._snap_to_center_alternate = self.snap_to_center_alternate
-        self._turn_off_snapping = self.turn_off_snapping
-        self._debug_keep_cut_obj = False
-        self.context = context
-        self.object = context.edit_object
         addons_prefs = context.preferences.addons
 
         id = 'half_knife'
-        self.prefs = addons_prefs[id].preferences if id in addons_prefs else preferences.HalfKnifePreferencesDefaults()
+        prefs = addons_prefs[id].preferences if id in addons_prefs else preferences.HalfKnifePreferencesDefaults()
 
-        profiler.enabled = self.prefs.use_profiler
+        profiler.enabled = prefs.use_profiler
+        profiler.set_history_size(prefs.profiler_history_size)
 
-        self.bmesh = bmesh.from_edit_mesh(self.object.data)
+        # the cut starts in the object with selected verts, the active one if it has them
+        objects = [o for o in context.objects_in_mode_unique_data if o.type == 'MESH']
+        start_object = context.edit_object
+        if not start_object.data.total_vert_sel:
+            start_object = next((o for o in objects if o.data.total_vert_sel), start_object)
 
-        self.initial_vertices = [v for v in self.bmesh.verts if v.select]
-        vert_len = len(self.initial_vertices)
-        self.is_multiple_verts = vert_len > 1
-        if vert_len > 10:
+        if not self.setup(context, start_object, prefs, objects):
             self.report({'ERROR'}, 'Too many vertices selected! Canceling.')
             return {'CANCELLED'}
+        vert_len = len(self.initial_vertices)
 
-        self.tree = BVHTree.FromBMesh(self.bmesh)
-        self.util = GeometryMath(context, self.object)
-
-        self.is_cut_from_new_vertex = False
-        self.virtual_start = None
         auto_cut = self.auto_cut
         if vert_len == 0:
             vert, center = self.addVert(context, event)
@@ -764,7 +1247,10 @@ class HalfKnifeOperator(bpy.types.Operator):
                     # return {'FINISHED'}
                 if self._snap_to_center:
                     vert.co = center
+                    self.mesh_sync.mark(destructive = False)
                 if not self.virtual_start:
+                    self.mesh_sync.flush()
+                    self.keep_structures()
                     return {'FINISHED'}
                 # return {'FINISHED'}
             #else snapped vertex is selected, not the new
@@ -785,6 +1271,8 @@ class HalfKnifeOperator(bpy.types.Operator):
             self.calc_hit(context, event)
             if self.snap_mode != 'VOID':
                 self.run_cut()
+                self.keep_structures()
+                profiler.report(bpy.path.abspath(prefs.profiler_trace_path))
                 return {'FINISHED'}
 
 
@@ -794,21 +1282,131 @@ class HalfKnifeOperator(bpy.types.Operator):
             if not self.is_cut_from_new_vertex:
                 self.inital_centered_hit = self.initial_hit
 
-
-        self.last_hited_face = None
-
         if not self.prefs.disable_knife_icon:
             context.window.cursor_modal_set("KNIFE")
-        self.draw = Draw(context, context.object.matrix_world)
+        self.draw = Draw(context, self.object.matrix_world)
+        self.pending_move = None
+        self._timer = None
+        if self.prefs.preview_max_fps > 0:
+            self._timer = context.window_manager.event_timer_add(1 / self.prefs.preview_max_fps, window = context.window)
+        profiler.reset_counters()
+        profiler.latency.reset(self.prefs.frame_budget)
+        # the start vertex
+        self.mesh_sync.flush()
         context.window_manager.modal_handler_add(self)
         self.draw.draw_start()
+        # mouse moves return before modal updates the header
+        self.draw_helper_text()
 
         return {'RUNNING_MODAL'}
 
+class HalfKnifeSegment(bpy.types.PropertyGroup):
+    start: bpy.props.FloatVectorProperty(name="Start", size=3)
+    end: bpy.props.FloatVectorProperty(name="End", size=3)
+    snap: bpy.props.BoolProperty(name="Snapping", default=True)
+    snap_to_center: bpy.props.BoolProperty(name="Snap to center", default=False)
+    cut_through: bpy.props.BoolProperty(name="Cut through", default=False)
+
+class HalfKnifeBatchOperator(HalfKnifeCut, bpy.types.Operator):
+    """Cut a list of segments at once"""
+    bl_idname = "mesh.half_knife_batch"
+    bl_label = "Half knife batch"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    segments: bpy.props.CollectionProperty(type=HalfKnifeSegment)
+    space: bpy.props.EnumProperty(name="Space",
+        items = [("OBJECT", "Object", "Segment ends are object space points of the edit object"),
+            ("SCREEN", "Screen", "Segment ends are region pixels, z is ignored"),],
+        default="OBJECT")
+    cut_engine: bpy.props.EnumProperty(name="Cut engine",
+        items = [("PREFERENCES", "From preferences", "Use the engine chosen in the addon preferences"),
+            ("KNIFE_PROJECT", "Knife project", "Project a temporary cut object with the knife project operator"),
+            ("BMESH", "Native bmesh", "Split crossed faces directly in the edit mesh"),],
+        default="BMESH")
+
+    # per segment in execute
+    auto_cut = True
+    altitude_mode = False
+    snap_to_center = False
+    snap_to_center_alternate = False
+    cut_through = False
+    turn_off_snapping = False
+
+    @classmethod
+    def poll(cls, context):
+        return HalfKnifeOperator.poll(context)
+
+    def segment_pixels(self, segment):
+        if self.space == 'SCREEN':
+            return MouseMove(segment.start[0], segment.start[1]), MouseMove(segment.end[0], segment.end[1])
+        start = self.util.location_3d_to_region_2d_object_space(mathutils.Vector(segment.start))
+        end = self.util.location_3d_to_region_2d_object_space(mathutils.Vector(segment.end))
+        if not start or not end:
+            return None, None
+        return MouseMove(start.x, start.y), MouseMove(end.x, end.y)
+
+    def cut_segment(self, context, segment):
+        """Does what a click, a move and a click do in the modal operator. Returns False if the segment was skipped."""
+        start, end = self.segment_pixels(segment)
+        if not start:
+            return False
+        self._cut_through = segment.cut_through
+        self._snap_to_center = segment.snap_to_center
+        self._turn_off_snapping = not segment.snap
+        self.virtual_start = None
+
+        # the end vertex of the previous cut
+        self.select_only([])
+
+        vert, center = self.addVert(context, start)
+        self.initial_vertices = [vert]
+        self.calc_hit(context, end)
+        if self.virtual_start and self.snap_mode == 'VOID':
+            self.delete_vitrual_vertex()
+            return False
+        self.run_cut()
+        return True
+
+    def execute(self, context):
+        addons_prefs = context.preferences.addons
+
+        id = 'half_knife'
+        prefs = addons_prefs[id].preferences if id in addons_prefs else preferences.HalfKnifePreferencesDefaults()
+
+        profiler.enabled = prefs.use_profiler
+        profiler.set_history_size(prefs.profiler_history_size)
+
+        # every segment starts in its own vertex, the selection isn't used
+        self.setup(context, context.edit_object, prefs, start_from_selection = False)
+        # the grid covers the whole view and is rebuilt after every edit
+        self.snap_grid = self.target.snap_grid = None
+        self.defer_mesh_update = True
+        # only the elements selected by the segments are deselected again
+        self.own_selection = set()
+        self.tracker = ElementTracker(self.bmesh)
+
+        done = 0
+        try:
+            for segment in self.segments:
+                if self.cut_segment(context, segment):
+                    done += 1
+        finally:
+            self.tracker.remove()
+            self.tracker = None
+
+        self.mesh_sync.flush()
+        self.keep_structures()
+        profiler.report(bpy.path.abspath(prefs.profiler_trace_path))
+        if done < len(self.segments):
+            self.report({'WARNING'}, "%d of %d segments missed the mesh" % (len(self.segments) - done, len(self.segments)))
+        return {'FINISHED'}
+
 classes = (
     preferences.HalfKnifePreferences,
     preferences.HalfKnifePreferencesAddKeymapOperator,
     HalfKnifeOperator,
+    HalfKnifeSegment,
+    HalfKnifeBatchOperator,
 )
 
 def menu_func(self, context):
@@ -822,6 +1420,7 @@ def register():
         bpy.utils.register_class(cls)
 
     preferences.register_keymaps()
+    bvh_cache.register()
     bpy.types.VIEW3D_MT_edit_mesh.append(menu_func)
 
 def unregister():
@@ -831,6 +1430,7 @@ def unregister():
     bpy.types.VIEW3D_MT_edit_mesh.remove(menu_func)
 
     preferences.unregister_keymaps()
+    bvh_cache.unregister()
 
 if __name__ == "__main__":
     register()
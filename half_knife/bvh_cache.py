@@ -0,0 +1,136 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Picking BVHs kept between the operator runs, keyed by the mesh datablock.
+#
+# An entry is valid while the edit mesh is the same bmesh, its element counts
+# didn't change and the depsgraph reported no geometry update of the mesh since
+# it was stored. Entries are stored from a timer, which runs after the
+# depsgraph has seen the last edit of the operator, so that edit doesn't
+# invalidate it.
+
+import functools
+from collections import OrderedDict
+import bpy
+import bmesh
+from bpy.app.handlers import persistent
+from .spatial_index import SpatialIndex
+from . import preferences
+from . import profiler
+
+entries = OrderedDict()
+# geometry updates per mesh session_uid
+updates = {}
+last_edit_object = None
+
+
+class Entry:
+    __slots__ = ("bm", "tree", "signature", "updates")
+
+    def __init__(self, bm, tree, signature, updates):
+        self.bm = bm
+        self.tree = tree
+        self.signature = signature
+        self.updates = updates
+
+
+def signature(bm):
+    return (len(bm.verts), len(bm.edges), len(bm.faces))
+
+def get(mesh, bm, view = None):
+    """The cached SpatialIndex of the mesh or None. A cached view filter is moved to the view of the new one."""
+    drop_invalid()
+    key = mesh.session_uid
+    # a failed check drops the entry with its trees
+    entry = entries.pop(key, None)
+    if not entry:
+        return None
+    if (entry.bm is not bm or not bm.is_valid or entry.updates != updates.get(key, 0)
+            or entry.signature != signature(bm) or (entry.tree.view is None) != (view is None)):
+        profiler.count("BVH cache misses")
+        return None
+    entries[key] = entry
+    if view:
+        entry.tree.view.projector = view.projector
+        entry.tree.view.margin = view.margin
+        entry.tree.view.version = None
+    profiler.count("BVH cache hits")
+    return entry.tree
+
+def put(key, bm, tree, size):
+    entries.pop(key, None)
+    if size <= 0 or not bm.is_valid:
+        return
+    entries[key] = Entry(bm, tree, signature(bm), updates.get(key, 0))
+    while len(entries) > size:
+        entries.popitem(last = False)
+
+def put_later(mesh, bm, tree, size):
+    """Stores the tree after the depsgraph update of the last edit."""
+    key = mesh.session_uid
+    def store():
+        put(key, bm, tree, size)
+    bpy.app.timers.register(store, first_interval = 0)
+
+def drop_invalid():
+    """Frees the entries whose edit mesh is gone, e.g. after leaving edit mode."""
+    for key in [key for key, entry in entries.items() if not entry.bm.is_valid]:
+        del entries[key]
+
+def clear():
+    entries.clear()
+    updates.clear()
+
+def prewarm(name):
+    prefs = preferences.get_addon_prefs()
+    obj = bpy.data.objects.get(name)
+    if not prefs or not obj or obj.type != 'MESH' or obj.mode != 'EDIT':
+        return
+    bm = bmesh.from_edit_mesh(obj.data)
+    if get(obj.data, bm) is None:
+        put(obj.data.session_uid, bm, SpatialIndex(bm), prefs.bvh_cache_size)
+
+def check_prewarm():
+    global last_edit_object
+    drop_invalid()
+    prefs = preferences.get_addon_prefs()
+    obj = bpy.context.view_layer.objects.active
+    name = obj.name if obj and obj.type == 'MESH' and obj.mode == 'EDIT' else None
+    # the view restricted tree depends on the view, it is built by the operator
+    if name and name != last_edit_object and prefs and prefs.use_bvh_prewarm and not prefs.use_view_bvh and prefs.bvh_cache_size > 0:
+        bpy.app.timers.register(functools.partial(prewarm, name), first_interval = .1)
+    last_edit_object = name
+
+@persistent
+def on_depsgraph_update(scene, depsgraph):
+    for update in depsgraph.updates:
+        if not update.is_updated_geometry:
+            continue
+        id = update.id.original
+        if isinstance(id, bpy.types.Object):
+            id = id.data if id.type == 'MESH' else None
+        if isinstance(id, bpy.types.Mesh):
+            updates[id.session_uid] = updates.get(id.session_uid, 0) + 1
+    check_prewarm()
+
+def register():
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+
+def unregister():
+    if on_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(on_depsgraph_update)
+    clear()
@@ -17,45 +17,107 @@
 
 import bpy
 import gpu
-from gpu_extras.batch import batch_for_shader
 #import time
 import mathutils
-from functools import cmp_to_key
+from collections import OrderedDict
+from .draw_buffers import vertex_array
+from . import profiler
+
+
+class GPUBackend:
+    """Uploads the preview vertex data to the GPU. Shaders are created on the first draw."""
+
+    def __init__(self):
+        self.format = None
+        self.shader = None
+        self.edge_shader = None
+
+    def make_batch(self, primitive, coords, indices = None):
+        if not len(coords):
+            return None
+        if not self.format:
+            self.format = gpu.types.GPUVertFormat()
+            self.format.attr_add(id = "pos", comp_type = 'F32', len = 3, fetch_mode = 'FLOAT')
+        vbo = gpu.types.GPUVertBuf(self.format, len(coords))
+        vbo.attr_fill("pos", coords)
+        ibo = gpu.types.GPUIndexBuf(type = primitive, seq = indices) if indices is not None else None
+        return gpu.types.GPUBatch(type = primitive, buf = vbo, elem = ibo)
+
+    def begin(self, region, matrix):
+        if not self.shader:
+            self.shader = gpu.shader.from_builtin('UNIFORM_COLOR')
+            self.edge_shader = gpu.shader.from_builtin('POLYLINE_UNIFORM_COLOR')
+            self.edge_shader.uniform_float("lineWidth", 3.0)
+        self.edge_shader.uniform_float("viewportSize", (region.width, region.height))
+        gpu.state.blend_set("ALPHA")
+        self.shader.bind()
+        self.edge_shader.bind()
+        gpu.matrix.push()
+        gpu.matrix.multiply_matrix(matrix)
+
+    def draw(self, batch, batch_type, color):
+        shader = self.edge_shader if batch_type == 'edge' else self.shader
+        shader.uniform_float("color", color)
+        batch.draw(shader)
+
+    def end(self):
+        gpu.matrix.pop()
+
 
 class Draw:
 
-    def __init__(self, context, matrix):
+    # face < edge < vert
+    draw_order = ('face', 'edge', 'vert')
+    cache_size = 64
+
+    def __init__(self, context, matrix, backend = None):
         self.matrix = matrix
+        # nothing touches the GPU before the first draw, so HeadlessBackend works without it
+        self.backend = backend or GPUBackend()
         self.context = context
-        self.shader = gpu.shader.from_builtin('UNIFORM_COLOR')
-        self.edge_shader = gpu.shader.from_builtin('POLYLINE_UNIFORM_COLOR')
-
-        region = bpy.context.region
-        self.edge_shader.uniform_float("viewportSize", (region.width, region.height))
-        self.edge_shader.uniform_float("lineWidth", 3.0)
 
         self.batches = []
-        gpu.state.blend_set("ALPHA")
+        # batches and tessellations are keyed by the object space coordinates they are built from
+        self.batch_cache = OrderedDict()
+        self.tessellation_cache = OrderedDict()
+        self.last_key = None
+
+    def cached(self, cache, key, build):
+        item = cache.get(key)
+        if item is None:
+            item = build()
+            cache[key] = item
+            if len(cache) > self.cache_size:
+                cache.popitem(last = False)
+        else:
+            cache.move_to_end(key)
+        return item
+
+    # coordinates stay in the object space, matrix_world is applied in _draw
 
-    def batch_polygon(self, face):
-        vertices = [self.matrix @ v.co for v in face.verts] if face else []
-        indices = mathutils.geometry.tessellate_polygon((vertices,))
-        return batch_for_shader(
-            self.shader, 'TRIS',
-            {"pos": vertices},
-            indices=indices,
-        )
+    def batch_polygon(self, coords):
+        indices = self.cached(self.tessellation_cache, coords, lambda: mathutils.geometry.tessellate_polygon(([mathutils.Vector(co) for co in coords],)))
+        return self.backend.make_batch('TRIS', vertex_array(coords), indices)
 
-    def batch_vertices(self, vertices):
-        vertices = [self.matrix @ v for v in vertices]
-        return batch_for_shader(self.shader, 'POINTS', {"pos": vertices})
+    def batch_vertices(self, coords):
+        return self.backend.make_batch('POINTS', vertex_array(coords))
 
-    def batch_edges(self, edges):
-#       vertex coordinates in edges
-        coords = [self.matrix @ v['co'] for e in edges for v in e['verts']]
+    def batch_edges(self, coords):
+        return self.backend.make_batch('LINES', vertex_array(coords))
 
-#        shader = gpu.shader.from_builtin('3D_UNIFORM_COLOR')
-        return batch_for_shader(self.edge_shader, 'LINES', {"pos": coords})
+    def geom_key(self, batch_type, geom):
+        if batch_type == 'face':
+            return tuple([v.co.to_tuple() for v in geom.verts]) if geom else ()
+        elif batch_type == 'edge':
+            return tuple([tuple(v['co']) for e in geom for v in e['verts']])
+        return tuple([tuple(v) for v in geom])
+
+    def build_batch(self, batch_type, coords):
+        if batch_type == 'face':
+            return self.batch_polygon(coords)
+        elif batch_type == 'edge':
+            return self.batch_edges(coords)
+        return self.batch_vertices(coords)
 
     def draw_start(self):
 #        args = (self, context)
@@ -67,41 +129,42 @@ class Draw:
         self.redraw()
 
     def clear(self):
+        """Returns False if nothing was drawn anyway."""
+        if self.last_key == ():
+            return False
         self.batches = []
+        self.last_key = ()
+        return True
 
     def batch(self, dict):
+        """Returns False if the preview is the same as the last one, so the redraw can be skipped."""
+        items = []
+        for batch_type in self.draw_order:
+            for geom, color in dict.get(batch_type, []):
+                items.append((batch_type, self.geom_key(batch_type, geom), tuple(color)))
+        key = tuple(items)
+        if key == self.last_key:
+            return False
+        self.last_key = key
+
         self.batches = []
-        for key, val in dict.items():
-            if key == 'face':
-                for t in val:
-                    self.batches.append((self.batch_polygon(t[0]), t[1], 'face'))
-            elif key == 'edge':
-                for t in val:
-                    self.batches.append((self.batch_edges(t[0]), t[1], 'edge'))
-            elif key == 'vert':
-                for t in val:
-                    self.batches.append((self.batch_vertices(t[0]), t[1], 'vert'))
+        for batch_type, coords, color in items:
+            b = self.cached(self.batch_cache, (batch_type, coords), lambda: self.build_batch(batch_type, coords))
+            self.batches.append((b, color, batch_type))
+        return True
 
 
     def _draw(self):
+        with profiler.latency.event("Draw callback"):
+            self.draw_batches()
+
+    def draw_batches(self):
 #        if not self.batch:
 #            return
-        self.shader.bind()
-        self.edge_shader.bind()
-        
-        # face < edge < vert
-        def comparator(t1, t2):
-            if t1[2] == t2[2]:
-                return 0
-            elif t1[2] == 'vert' or t1[2] == 'edge' and t2[2] == 'face':
-                return 1
-            else:
-                return -1
-            
-        batches = sorted(self.batches, key = cmp_to_key(comparator), reverse = False)
-        for b, color, batchType in batches:
-            shader = self.edge_shader if batchType == "edge" else self.shader
-            shader.uniform_float("color", color)
-            b.draw(shader)
-        
-                
\ No newline at end of file
+        self.backend.begin(self.context.region, self.matrix)
+        # batches are already in the draw order
+        for b, color, batchType in self.batches:
+            if not b:
+                continue
+            self.backend.draw(b, batchType, color)
+        self.backend.end()
@@ -0,0 +1,51 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# This module doesn't import bpy or gpu, so the preview batch building can be
+# measured without a GPU by passing HeadlessBackend to Draw.
+
+import numpy as np
+
+
+def vertex_array(coords):
+    """N×3 float32 array of the coordinate tuples. GPUVertBuf.attr_fill reads it through the buffer protocol."""
+    return np.array(coords, dtype = np.float32).reshape(-1, 3)
+
+
+class HeadlessBackend:
+    """Stand-in for GPUBackend. It keeps the vertex data instead of uploading it."""
+
+    def __init__(self):
+        self.uploaded_vertices = 0
+        self.batch_count = 0
+        self.draw_count = 0
+
+    def make_batch(self, primitive, coords, indices = None):
+        if not len(coords):
+            return None
+        self.uploaded_vertices += len(coords)
+        self.batch_count += 1
+        return (primitive, coords, indices)
+
+    def begin(self, region, matrix):
+        pass
+
+    def draw(self, batch, batch_type, color):
+        self.draw_count += 1
+
+    def end(self):
+        pass
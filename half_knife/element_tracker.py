@@ -0,0 +1,63 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+class ElementTracker:
+    """Tells the verts known before an edit from the verts created by it.
+
+    Known verts get a key in a temporary integer layer. Verts created later
+    have no key or inherit an interpolated key from their neighbours. Such keys
+    don't point back to the same vert in the registry, so the check is O(1) and
+    never needs a scan of the whole mesh.
+    """
+
+    layer_name = "half_knife_key"
+
+    def __init__(self, bm):
+        self.bm = bm
+        layers = bm.verts.layers.int
+        self.layer = layers.get(self.layer_name) or layers.new(self.layer_name)
+        # key 0 is the default value of the layer
+        self.registry = [None]
+
+    def mark(self, verts):
+        layer = self.layer
+        for v in verts:
+            if self.is_known(v):
+                continue
+            v[layer] = len(self.registry)
+            self.registry.append(v)
+
+    def key(self, vert):
+        self.mark([vert])
+        return vert[self.layer]
+
+    def get(self, key):
+        return self.registry[key]
+
+    def is_known(self, vert):
+        key = vert[self.layer]
+        return 0 < key < len(self.registry) and self.registry[key] == vert
+
+    def new_verts(self):
+        """The verts without a key of their own, this one visits the whole mesh."""
+        return [v for v in self.bm.verts if not self.is_known(v)]
+
+    def remove(self):
+        layers = self.bm.verts.layers.int
+        if layers.get(self.layer_name):
+            layers.remove(self.layer)
@@ -0,0 +1,275 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Snapping and projection math on coordinate arrays. It depends only on NumPy,
+# so it runs and can be measured outside of Blender. Matrices are 4×4 arrays,
+# points are N×3 object space or N×2 region pixel arrays.
+
+import numpy as np
+
+
+def project_points(object_to_clip, width, height, co):
+    """N×3 points to N×2 region pixels. Points behind the view are nan."""
+    co = np.asarray(co, dtype = np.float64).reshape(-1, 3)
+    matrix = np.asarray(object_to_clip, dtype = np.float64)
+    prj = co @ matrix[:3, :3].T + matrix[:3, 3]
+    w = co @ matrix[3, :3] + matrix[3, 3]
+    px = np.full((len(co), 2), np.nan)
+    front = w > 0
+    px[front, 0] = (1 + prj[front, 0] / w[front]) * (width / 2)
+    px[front, 1] = (1 + prj[front, 1] / w[front]) * (height / 2)
+    return px
+
+def unproject_points(clip_to_world, width, height, px, is_perspective, view_origin, ortho_origin_z = -1):
+    """N×2 region pixels to N×3 world space ray origins and normalized directions.
+
+    Orthographic rays start at the clip space depth ortho_origin_z, the near
+    clip by default and 0 in a camera view, like region_2d_to_origin_3d.
+    """
+    px = np.asarray(px, dtype = np.float64).reshape(-1, 2)
+    inv = np.asarray(clip_to_world, dtype = np.float64)
+    n = len(px)
+    ndc = np.empty((n, 4))
+    ndc[:, 0] = 2 * px[:, 0] / width - 1
+    ndc[:, 1] = 2 * px[:, 1] / height - 1
+    ndc[:, 3] = 1
+    def to_world(z):
+        ndc[:, 2] = z
+        p = ndc @ inv.T
+        return p[:, :3] / p[:, 3:]
+    near = to_world(-1)
+    far = to_world(1)
+    direction = far - near
+    direction /= np.linalg.norm(direction, axis = 1)[:, None]
+    origin = np.broadcast_to(np.asarray(view_origin, dtype = np.float64), (n, 3)) if is_perspective else to_world(ortho_origin_z)
+    return origin, direction
+
+def vertex_project(points, a, b):
+    """Projections of N×3 points on the lines through the N×3 ends a and b."""
+    ab = b - a
+    l = (ab * ab).sum(axis = 1)
+    k = np.zeros(len(ab))
+    nonzero = l > 0
+    k[nonzero] = ((points - a)[nonzero] * ab[nonzero]).sum(axis = 1) / l[nonzero]
+    return a + ab * k[:, None]
+
+def split_ratio(projected, a, b):
+    """Vectorized GeometryMath.get_split_ratio."""
+    length = np.sqrt(((b - a) ** 2).sum(axis = 1))
+    d1 = np.sqrt(((a - projected) ** 2).sum(axis = 1))
+    d2 = np.sqrt(((b - projected) ** 2).sum(axis = 1))
+    ratio = np.where(d1 > d2, 1.0, 0.0)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        ratio = np.where(np.abs(d1 + d2 - length) < 0.001, d1 / length, ratio)
+    ratio[length == 0] = 0
+    return ratio
+
+def points_on_edges(points, a, b, dist, max_pairs = 1 << 20):
+    """Vectorized is_point_on_edge for every pair of N×3 points and M edges given by M×3 ends.
+
+    A point on an edge is within half of the edge length plus dist from its
+    center, so only the points in that x range are measured, at most max_pairs
+    pairs at once. Returns edge indices and point indices of the hits, ordered by edge.
+    """
+    points = np.asarray(points, dtype = np.float32).reshape(-1, 3)
+    a = np.asarray(a, dtype = np.float32).reshape(-1, 3)
+    b = np.asarray(b, dtype = np.float32).reshape(-1, 3)
+    order = np.argsort(points[:, 0], kind = 'stable')
+    xs = points[order, 0]
+    center = (a[:, 0] + b[:, 0]) / 2
+    reach = (np.sqrt(((b - a) ** 2).sum(axis = 1)) + dist) / 2
+    lo = np.searchsorted(xs, center - reach, 'left')
+    counts = np.searchsorted(xs, center + reach, 'right') - lo
+    total = np.cumsum(counts)
+    edge_hits = [np.zeros(0, dtype = np.int64)]
+    point_hits = [np.zeros(0, dtype = np.int64)]
+    start = 0
+    while start < len(a):
+        # at least one edge per chunk
+        done = total[start - 1] if start else 0
+        end = max(int(np.searchsorted(total, done + max_pairs, 'right')), start + 1)
+        c = counts[start:end]
+        edges = np.repeat(np.arange(start, end), c)
+        candidates = order[np.repeat(lo[start:end] - np.cumsum(c) + c, c) + np.arange(int(c.sum()))]
+        p, ea, eb = points[candidates], a[edges], b[edges]
+        ab = np.sqrt(((eb - ea) ** 2).sum(axis = 1))
+        l1 = np.sqrt(((p - ea) ** 2).sum(axis = 1))
+        l2 = np.sqrt(((p - eb) ** 2).sum(axis = 1))
+        hits = (l1 != 0) & (l2 != 0) & (np.abs(ab - (l1 + l2)) < dist)
+        edge_hits.append(edges[hits])
+        point_hits.append(candidates[hits])
+        start = end
+    edge_hits = np.concatenate(edge_hits)
+    point_hits = np.concatenate(point_hits)
+    hit_order = np.lexsort((point_hits, edge_hits))
+    return edge_hits[hit_order], point_hits[hit_order]
+
+def closest_edge(point, a, b, cull_zero_edges = True):
+    """The edge closest to the point by the smallest of the distances to its line and its ends.
+
+    Edges are given by N×3 ends. Returns the edge index or -1, True if its first
+    vert is closer to the point, the projection of the point on the edge line and
+    the closest point of the edge.
+    """
+    p = np.asarray(point, dtype = np.float64)
+    projected = vertex_project(p, a, b)
+    d1 = np.sqrt(((p - a) ** 2).sum(axis = 1))
+    d2 = np.sqrt(((p - b) ** 2).sum(axis = 1))
+    h = np.sqrt(((p - projected) ** 2).sum(axis = 1))
+    ratio = split_ratio(projected, a, b)
+
+    edge_distance = np.minimum(h, np.minimum(d1, d2))
+    if cull_zero_edges:
+        edge_distance = np.where((ratio == 0) | (ratio == 1), np.inf, edge_distance)
+    if not len(edge_distance):
+        return -1, False, None, None
+    i = int(np.argmin(edge_distance))
+    if not edge_distance[i] < np.inf:
+        return -1, False, None, None
+    # to solve concave ngons
+    closest = b[i] if ratio[i] == 1 else a[i] if ratio[i] == 0 else projected[i]
+    return i, bool(d1[i] < d2[i]), projected[i], closest
+
+def point_to_segments_distance_2d(point, a, b):
+    """Pixel distances from a point to N segments given by N×2 arrays. Returns distances and segment factors."""
+    p = np.array((point[0], point[1]))
+    ab = b - a
+    ap = p - a
+    l = (ab * ab).sum(axis = 1)
+    t = np.zeros(len(a))
+    nonzero = l > 0
+    t[nonzero] = np.clip((ap[nonzero] * ab[nonzero]).sum(axis = 1) / l[nonzero], 0, 1)
+    d = ap - t[:, None] * ab
+    return np.sqrt((d * d).sum(axis = 1)), t
+
+def clip_segments(a, b, lo, hi):
+    """Liang-Barsky clipping of N×2 segments by the rectangle lo-hi. Returns the mask and the clipped ends."""
+    d = b - a
+    t0 = np.zeros(len(a))
+    t1 = np.ones(len(a))
+    keep = np.ones(len(a), dtype = bool)
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        for axis in (0, 1):
+            for p, q in ((-d[:, axis], a[:, axis] - lo[axis]), (d[:, axis], hi[axis] - a[:, axis])):
+                r = q / p
+                keep &= ~((p == 0) & (q < 0))
+                t0 = np.where(p < 0, np.maximum(t0, r), t0)
+                t1 = np.where(p > 0, np.minimum(t1, r), t1)
+    keep &= t0 <= t1
+    return keep, a + t0[:, None] * d, a + t1[:, None] * d
+
+def sample_segments(a, b, step):
+    """Points along N×2 segments not farther than step from each other. Returns segment indices and points."""
+    samples = np.ceil(np.sqrt(((b - a) ** 2).sum(axis = 1)) / step).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(a)), samples)
+    i = np.arange(len(segment)) - np.repeat(np.cumsum(samples) - samples, samples)
+    t = i / np.maximum(samples - 1, 1)[segment]
+    return segment, a[segment] + t[:, None] * (b - a)[segment]
+
+def join_cells(keys_a, ids_a, keys_b, ids_b):
+    """All pairs of ids with equal cell keys."""
+    order = np.argsort(keys_b, kind = 'stable')
+    keys_b = keys_b[order]
+    ids_b = ids_b[order]
+    starts = np.searchsorted(keys_b, keys_a, 'left')
+    counts = np.searchsorted(keys_b, keys_a, 'right') - starts
+    first = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return np.repeat(ids_a, counts), ids_b[first + np.arange(int(counts.sum()))]
+
+def points_near_segments_2d(points, a, b, radius, width, height):
+    """Pairs of N×2 points and M segments given by M×2 ends which are not farther than radius pixels.
+
+    Points and segment samples meet in the cells of a screen space grid over the
+    width×height region, so only the close pairs are measured. Returns point
+    indices, segment indices and segment factors.
+    """
+    points = np.asarray(points, dtype = np.float64).reshape(-1, 2)
+    a = np.asarray(a, dtype = np.float64).reshape(-1, 2)
+    b = np.asarray(b, dtype = np.float64).reshape(-1, 2)
+    # an element closer than the radius is in the 3×3 cells around a sample
+    cell = max(2 * radius, 8)
+    lo = np.array((-cell, -cell))
+    hi = np.array((width + cell, height + cell))
+    rows = int((hi[1] - lo[1]) // cell) + 3
+    def cell_keys(px):
+        cells = np.floor((px - lo) / cell).astype(np.int64) + 1
+        return cells[:, 0] * rows + cells[:, 1]
+
+    with np.errstate(invalid = 'ignore'):
+        inside = np.all((points >= lo) & (points <= hi), axis = 1)
+    point_ids = np.flatnonzero(inside)
+    # parts of the segments outside the rectangle may still be close to the points inside it
+    keep, clipped_a, clipped_b = clip_segments(a, b, lo - cell, hi + cell)
+    segment_ids = np.flatnonzero(keep)
+    sample_segment, samples = sample_segments(clipped_a[keep], clipped_b[keep], cell)
+    sample_ids = segment_ids[sample_segment]
+
+    neighbours = np.array([dx * rows + dy for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+    point_keys = cell_keys(points[point_ids])
+    sample_keys = cell_keys(samples)
+    # the smaller side is spread over the neighbour cells
+    if len(point_ids) < len(sample_ids):
+        point_keys = (point_keys[:, None] + neighbours).ravel()
+        point_ids = np.repeat(point_ids, len(neighbours))
+    else:
+        sample_keys = (sample_keys[:, None] + neighbours).ravel()
+        sample_ids = np.repeat(sample_ids, len(neighbours))
+    pi, si = join_cells(point_keys, point_ids, sample_keys, sample_ids)
+    pairs = np.unique(pi * max(len(a), 1) + si)
+    pi = pairs // max(len(a), 1)
+    si = pairs % max(len(a), 1)
+
+    sa = a[si]
+    ab = b[si] - sa
+    ap = points[pi] - sa
+    l = (ab * ab).sum(axis = 1)
+    t = np.zeros(len(pi))
+    nonzero = l > 0
+    t[nonzero] = np.clip((ap[nonzero] * ab[nonzero]).sum(axis = 1) / l[nonzero], 0, 1)
+    d = ap - t[:, None] * ab
+    near = (d * d).sum(axis = 1) <= radius * radius
+    return pi[near], si[near], t[near]
+
+def nearest_line(point, a, b):
+    """Index of the line through the N×3 ends a and b nearest to the point and the projection of the point on it."""
+    projected = vertex_project(np.broadcast_to(point, a.shape), a, b)
+    i = int(np.argmin(((projected - point) ** 2).sum(axis = 1)))
+    return i, projected[i]
+
+def increment_angles(increment):
+    """Multiples of the increment giving every line direction once, from -90° up to 90°."""
+    half = np.pi / 2
+    return np.arange(-np.floor(half / increment), np.floor((half - 1e-6) / increment) + 1) * increment
+
+def corner_axes(v1, v2, normals, angles = None):
+    """Angle constraint axes of N face corners, N×K×3 directions.
+
+    v1 and v2 are N×3 unit vectors along the two edges of a corner. Without
+    angles the axes are the bisector and the directions halfway between it
+    and the edges, otherwise the bisector turned in the face plane by each angle.
+    """
+    v = (v1 + v2) / 2
+    flat = np.sqrt((v * v).sum(axis = 1)) < .001
+    if flat.any():
+        side = np.cross(normals[flat], v2[flat])
+        v[flat] = side / np.maximum(np.linalg.norm(side, axis = 1), 1e-12)[:, None]
+    if angles is None:
+        return np.stack(((v1 + v) / 2, v, (v2 + v) / 2), axis = 1)
+    v /= np.maximum(np.linalg.norm(v, axis = 1), 1e-12)[:, None]
+    side = np.cross(normals, v)
+    side /= np.maximum(np.linalg.norm(side, axis = 1), 1e-12)[:, None]
+    return v[:, None] * np.cos(angles)[None, :, None] + side[:, None] * np.sin(angles)[None, :, None]
@@ -16,9 +16,30 @@
 # ##### END GPL LICENSE BLOCK #####
 
 
-from bpy_extras import view3d_utils
 import numpy as np
 import mathutils
+from .view_projector import ViewProjector
+from . import geometry_core
+
+
+class FaceSnapData:
+    """Object and screen space data of a face which snapping needs."""
+
+    def __init__(self, face, util):
+        self.edges = list(face.edges)
+        self.edge_index = dict([(e, i) for i, e in enumerate(self.edges)])
+        ends = np.array([v.co for e in self.edges for v in e.verts], dtype = np.float64).reshape(-1, 2, 3)
+        self.a = ends[:, 0]
+        self.b = ends[:, 1]
+        px = util.project_array(ends).reshape(-1, 2, 2)
+        self.a_px = px[:, 0]
+        self.b_px = px[:, 1]
+        self.edge_centers = (self.a + self.b) / 2
+        self.center = face.calc_center_median()
+
+    def edge_center(self, edge):
+        return mathutils.Vector(self.edge_centers[self.edge_index[edge]])
+
 
 class GeometryMath:
 
@@ -27,7 +48,7 @@ class GeometryMath:
         self.region = context.region
         self.rv3d = context.region_data
         self.matrix = object.matrix_world
-        self.matrix_inv = self.matrix.inverted()
+        self.projector = ViewProjector(self.region, self.rv3d, self.matrix)
 
     def get_view_plane(self):
         zero = self.get_viewport_point_object_space(0, 0)
@@ -41,27 +62,24 @@ class GeometryMath:
         point2d = self.location_3d_to_region_2d_object_space(point)
         return self.get_viewport_point_object_space(point2d.x, point2d.y)
 
-    def ray_cast_BVH(self, tree, bm, x, y):
+    def project_points_on_view(self, co):
+        """Batched project_point_on_view for N×3 points."""
+        origins, directions = self.projector.unproject(self.projector.project(co))
+        return origins + directions
+
+    def ray_cast_BVH(self, tree, x, y):
         ray_origin_obj, ray_direction_obj = self.get_view_object_space(x, y)
-        hit, normal, face_index, distance = tree.ray_cast(ray_origin_obj, ray_direction_obj)
+        hit, normal, face, distance = tree.ray_cast(ray_origin_obj, ray_direction_obj)
         if not hit:
             return None, None
-        return hit, bm.faces[face_index]
+        return hit, face
 
-    def ray_cast_point(self, tree, bm, vec):
+    def ray_cast_point(self, tree, vec):
         v = self.location_3d_to_region_2d_object_space(vec)
-        return self.ray_cast_BVH(tree, bm, v.x, v.y)
+        return self.ray_cast_BVH(tree, v.x, v.y)
 
     def get_view_object_space(self, x, y):
-        view_origin, view_vector = self.get_view_world_space(x, y)
-        ray_target = view_origin + view_vector
-
-        matrix_inv = self.matrix_inv
-        ray_origin_obj = matrix_inv @ view_origin
-        ray_target_obj = matrix_inv @ ray_target
-        ray_direction_obj = ray_target_obj - ray_origin_obj
-
-        return ray_origin_obj, ray_direction_obj
+        return self.projector.unproject_point(x, y)
 
     def get_viewport_point_world_space(self, x, y):
         view_origin, view_vector = self.get_view_world_space(x, y)
@@ -72,15 +90,53 @@ class GeometryMath:
         return view_origin + view_vector
 
     def get_view_world_space(self, x, y):
-        coord = x, y
-        view_vector = view3d_utils.region_2d_to_vector_3d(self.region, self.rv3d, coord)
-        view_origin = view3d_utils.region_2d_to_origin_3d(self.region, self.rv3d, coord)
-        return view_origin, view_vector
-
-
+        return self.projector.unproject_world_point(x, y)
 
     def location_3d_to_region_2d_object_space(self, v):
-        return view3d_utils.location_3d_to_region_2d(self.region, self.rv3d, self.matrix @ v)
+        return self.projector.project_point(v)
+
+    def project_array(self, co):
+        """Projects N×3 object space coordinates to region pixels. Points behind the view are nan."""
+        return self.projector.project(co)
+
+    def point_to_segments_distance_2d(self, point, a, b):
+        """Pixel distances from a point to N segments given by N×2 arrays. Returns distances and segment factors."""
+        return geometry_core.point_to_segments_distance_2d(point, a, b)
+
+    def points_near_segments_2d(self, points, a, b, radius):
+        """Pairs of N×2 points and M segments given by M×2 ends which are not farther than radius pixels.
+
+        Returns point indices, segment indices and segment factors.
+        """
+        self.projector.sync()
+        return geometry_core.points_near_segments_2d(points, a, b, radius, self.projector.width, self.projector.height)
+
+    def get_cut_points(self, co):
+        """Moves N×3 object space points along the view rays to one world unit from the view. Returns world space points and pixels."""
+        px = self.projector.project(co)
+        origins, directions = self.projector.unproject_world(px)
+        return origins + directions, px
+
+    def is_visible(self, tree, co):
+        px = self.location_3d_to_region_2d_object_space(co)
+        if not px:
+            return False
+        origin, direction = self.get_view_object_space(px.x, px.y)
+        direction = direction.normalized()
+        hit, normal, face, distance = tree.ray_cast(origin, direction)
+        if not hit:
+            return True
+        depth = (co - origin).dot(direction)
+        return distance >= depth - max(abs(depth) * 1e-4, 1e-5)
+
+    def edge_point_under_pixel(self, v1, v2, x, y):
+        """The point of the edge v1-v2 which is the closest to the view ray through the pixel."""
+        origin, direction = self.get_view_object_space(x, y)
+        res = mathutils.geometry.intersect_line_line(v1, v2, origin, origin + direction)
+        if not res:
+            return (v1 + v2) / 2
+        point, fac = mathutils.geometry.intersect_point_line(res[0], v1, v2)
+        return v1.lerp(v2, min(max(fac, 0), 1))
 
     def distance_2d(self, v1, v2):
          pxv1 = self.location_3d_to_region_2d_object_space(v1)
@@ -100,6 +156,13 @@ class GeometryMath:
         #print((v1 - v2).length - (l1 + l2))
         return abs((v1 - v2).length - (l1 + l2)) < dist
 
+    def points_on_edges(self, points, a, b, dist):
+        """Vectorized is_point_on_edge for every pair of N×3 points and M edges given by M×3 ends.
+
+        Returns edge indices and point indices of the hits, ordered by edge.
+        """
+        return geometry_core.points_on_edges(points, a, b, dist)
+
     def is_point_on_edge2(self, point, edge, dist):
         v1, v2 = [v.co for v in edge.verts]
         d1 = (point - v1).length
@@ -133,57 +196,27 @@ class GeometryMath:
         projected = v1 + temp
         return projected
 
-    def distance_to_edge(self, point, edge):
-        v1, v2 = [v.co for v in edge.verts]
-        d1 = (point - v1).length
-        d2 = (point - v2).length
-        projected = self.vertex_project(point, v1, v2)
-        h = (point - projected).length
+    def nearest_line(self, point, a, b):
+        """Index of the nearest of the lines through the N×3 ends a and b and the projection of the point on it."""
+        return geometry_core.nearest_line(np.asarray(point, dtype = np.float64), a, b)
+
+    def corner_axes(self, co, ends, normals, increment = 0):
+        """Angle constraint axes of N face corners at co, ends are the N×2×3 neighbour verts. Returns N×K×3 directions."""
+        edges = ends - co
+        edges /= np.maximum(np.linalg.norm(edges, axis = 2), 1e-12)[..., None]
+        angles = geometry_core.increment_angles(increment) if increment > 0 else None
+        return geometry_core.corner_axes(edges[:, 0], edges[:, 1], normals, angles)
+
+    def find_closest_vectorized(self, point, data, cull_zero_edges = True):
+        # the closest edge of FaceSnapData and its closer vert, the zero length edges are skipped with cull_zero_edges
+        i, first, projected, closest = geometry_core.closest_edge(point, data.a, data.b, cull_zero_edges)
+        if i < 0:
+            return None, None, float("inf"), float("inf"), None
+        px = self.project_array(np.vstack((point, closest)))
+        vert_px = data.a_px[i] if first else data.b_px[i]
+        def pixel_distance(a, b):
+            d = float(np.sqrt(((a - b) ** 2).sum()))
+            return float("inf") if np.isnan(d) else d
+        e = data.edges[i]
+        return e.verts[0 if first else 1], e, pixel_distance(vert_px, px[0]), pixel_distance(px[1], px[0]), mathutils.Vector(projected)
 
-        # to solve concave ngons
-        split_ratio = self.get_split_ratio(projected, edge)
-        closest_point_on_edge = projected
-        if split_ratio == 1:
-            closest_point_on_edge = v2
-        elif split_ratio == 0:
-            closest_point_on_edge = v1
-        edge_pixel_distance = self.distance_2d(point, closest_point_on_edge)
-
-        vertex_distance, vertex_index, vertex_pixel_distance = (d1, 0, self.distance_2d(v1, point)) if d1 < d2 else (d2, 1, self.distance_2d(v2, point))
-        edge_distance = min(h, d1, d2)
-
-        return edge_distance, vertex_distance, vertex_index, edge_pixel_distance, vertex_pixel_distance, projected, split_ratio
-
-    def find_closest(self, point, face, cull_zero_edges = True):
-        if not point:
-            return None, None, None, None
-
-        edge_dist = float("inf")
-        edge_pixel_distance = float("inf")
-        vertex_pixel_distance = float("inf")
-        edge = None
-        vert = None
-        projected = None
-        for e in face.edges:
-            try:
-                dRes = self.distance_to_edge(point, e)
-            except Exception as ex:
-                e.select_set(True)
-                raise ex
-
-            if (cull_zero_edges):
-                #projected_length = (dRes[5] - point).length
-                split_ratio = dRes[6]
-                #print(split_ratio)
-                if split_ratio in [0, 1]:
-                    continue
-
-            if dRes[0] < edge_dist:
-                edge_dist = dRes[0]
-                edge = e
-                vert = e.verts[dRes[2]]
-                edge_pixel_distance = dRes[3]
-                vertex_pixel_distance = dRes[4]
-                projected = dRes[5]
-
-        return vert, edge, vertex_pixel_distance, edge_pixel_distance, projected
@@ -0,0 +1,105 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import bpy
+import numpy as np
+from . import profiler
+
+
+def get(collection, name, count, dtype):
+    array = np.empty(count, dtype = dtype)
+    collection.foreach_get(name, array)
+    return array
+
+
+class MeshArrays:
+    """Coordinate and topology arrays of a bmesh.
+
+    The bmesh is written into a temporary mesh by bm.to_mesh and read with
+    foreach_get, so no Python code runs per element. The mesh of the edit
+    object is left alone, update_from_editmode would also write the temporary
+    layers of a cut into it. Elements are in the bmesh iteration order.
+    """
+
+    def __init__(self, bm, edges = False):
+        me = bpy.data.meshes.new("Half knife arrays")
+        try:
+            bm.to_mesh(me)
+            self.read(me, edges)
+        finally:
+            bpy.data.meshes.remove(me)
+
+    def read(self, me, edges):
+        nv, ne, nf, nl = len(me.vertices), len(me.edges), len(me.polygons), len(me.loops)
+        self.co = get(me.vertices, "co", nv * 3, np.float32).reshape(-1, 3).astype(np.float64)
+        self.loop_start = get(me.polygons, "loop_start", nf, np.int32)
+        self.loop_total = get(me.polygons, "loop_total", nf, np.int32)
+        self.face_hide = get(me.polygons, "hide", nf, bool)
+        self.loop_vert = get(me.loops, "vertex_index", nl, np.int32)
+        if edges:
+            self.vert_hide = get(me.vertices, "hide", nv, bool)
+            self.edge_verts = get(me.edges, "vertices", ne * 2, np.int32).reshape(-1, 2)
+            self.edge_hide = get(me.edges, "hide", ne, bool)
+            self.loop_edge = get(me.loops, "edge_index", nl, np.int32)
+            self.face_normals = get(me.polygons, "normal", nf * 3, np.float32).reshape(-1, 3).astype(np.float64)
+
+
+def face_loops(arrays, faces):
+    """Indices of the loops of the given faces, face by face."""
+    counts = arrays.loop_total[faces]
+    return np.repeat(arrays.loop_start[faces] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+
+class SharedMeshArrays:
+    """The MeshArrays of one edit mesh, shared by its view filter and snap grid.
+
+    The arrays are read on the first get() after a topology change, so the
+    mesh is copied once however many users it has. Moved verts are written
+    into the arrays. version increases with both, the users derive their data
+    again when it changes.
+    """
+
+    def __init__(self, bm):
+        self.bm = bm
+        self.arrays = None
+        self.version = 0
+
+    def get(self):
+        if self.arrays is None:
+            self.arrays = MeshArrays(self.bm, edges = True)
+            # the element numbers match the array rows while the topology is the same
+            self.bm.verts.index_update()
+            self.bm.faces.index_update()
+            self.version += 1
+            profiler.count("Mesh array reads")
+        return self.arrays
+
+    def invalidate(self):
+        """Call after a topology change."""
+        self.arrays = None
+
+    def move(self, verts):
+        """Call after moving verts without changing the topology."""
+        arrays = self.arrays
+        verts = list(verts)
+        if arrays is None or not verts:
+            return
+        faces = list(set([f for v in verts for f in v.link_faces]))
+        arrays.co[[v.index for v in verts]] = [v.co for v in verts]
+        if faces:
+            arrays.face_normals[[f.index for f in faces]] = [f.normal for f in faces]
+        self.version += 1
@@ -0,0 +1,50 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import bmesh
+from . import profiler
+
+
+class MeshSync:
+    """Deferred synchronisation of a bmesh with its edit mesh.
+
+    Edits only mark what they changed. The picking BVH is patched from the
+    bmesh directly and needs none of it, so the edit mesh with its loop
+    triangles is updated only by flush(), right before the viewport or
+    knife_project reads it.
+    """
+
+    def __init__(self, bm, mesh):
+        self.bm = bm
+        self.mesh = mesh
+        self.topology = False
+        self.geometry = False
+
+    def mark(self, destructive = True):
+        """Call after an edit. Non destructive edits only moved verts."""
+        self.geometry = True
+        if destructive:
+            self.topology = True
+
+    def flush(self):
+        if not self.geometry:
+            return False
+        bmesh.update_edit_mesh(self.mesh, loop_triangles = True, destructive = self.topology)
+        self.topology = False
+        self.geometry = False
+        profiler.count("Edit mesh flushes")
+        return True
@@ -0,0 +1,235 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import bmesh
+
+
+def dissolve_redundant_edges(bm, vert, excluded_verts = []):
+    dissolved_edges = []
+    l = len(vert.link_edges)
+    for e in vert.link_edges:
+        if not e.other_vert(vert) in excluded_verts and l > 2:
+            dissolved_edges.append(e)
+            l -= 1
+    # dissolved_edges = vert.link_edges[slice(len(vert.link_edges) - 2)]
+    bmesh.ops.dissolve_edges(bm, edges = dissolved_edges, use_verts = False, use_face_split = False)
+
+def is_adjacent(v1, v2):
+    for e in v1.link_edges:
+        if e.other_vert(v1) == v2:
+            return True
+    return False
+
+
+class NativeCut:
+    """Cuts the edit bmesh directly instead of using knife_project.
+
+    The cut plane contains the segment and the view ray, so on the screen the cut
+    looks like a straight line. Starting from the start vertex the cut walks from
+    face to face, splitting only the faces that the segment crosses.
+
+    A walk can stop before the end point, e.g. at a hole or a silhouette.
+    Such cuts are counted in missed, and in partial when they already split
+    faces.
+    """
+
+    max_steps = 10000
+
+    def __init__(self, bm, util, tree, snap_to_center = False):
+        self.bm = bm
+        self.util = util
+        self.tree = tree
+        self.snap_to_center = snap_to_center
+        self.path_verts = []
+        self.edits = 0
+        self.missed = 0
+        self.partial = 0
+
+    def resolve_target(self, co):
+        hit, face = self.util.ray_cast_point(self.tree, co)
+        if not hit:
+            return 'VOID', None
+        eps = self.epsilon
+        for v in face.verts:
+            if (v.co - co).length < eps:
+                return 'VERT', v
+        for e in face.edges:
+            v1, v2 = [v.co for v in e.verts]
+            if self.util.is_point_on_edge(co, v1, v2, eps):
+                return 'EDGE', e
+        return 'FACE', face
+
+    def progress(self, co):
+        px = self.util.location_3d_to_region_2d_object_space(co)
+        if not px:
+            return float("inf")
+        return (px - self.start_px).dot(self.axis_px) / self.axis_px.length_squared
+
+    def find_exit(self, face, current, t_current):
+        """Finds where the cut leaves the face. Returns (t, vert, edge, co)."""
+        best = None
+        start_co = self.start_co
+        normal = self.normal
+        eps = self.epsilon
+        for e in face.edges:
+            v1, v2 = e.verts
+            if current in (v1, v2):
+                continue
+            d1 = normal.dot(v1.co - start_co)
+            d2 = normal.dot(v2.co - start_co)
+            if abs(d1) < eps:
+                candidates = [(v1, None, v1.co)]
+            elif abs(d2) < eps:
+                candidates = [(v2, None, v2.co)]
+            elif (d1 > 0) != (d2 > 0):
+                fac = d1 / (d1 - d2)
+                candidates = [(None, e, v1.co.lerp(v2.co, fac))]
+            else:
+                continue
+            for vert, edge, co in candidates:
+                if vert == current:
+                    continue
+                t = self.progress(co)
+                if t <= t_current + 1e-6:
+                    continue
+                if not best or t < best[0]:
+                    best = (t, vert, edge, co)
+        return best
+
+    def split_edge_at(self, edge, co):
+        v1, v2 = edge.verts
+        length = (v2.co - v1.co).length
+        fac = (co - v1.co).length / length if length else .5
+        new_edge, vert = bmesh.utils.edge_split(edge, v1, fac)
+        vert.co = co
+        self.edits += 1
+        return vert
+
+    def split_edge(self, edge, co):
+        if self.snap_to_center:
+            v1, v2 = edge.verts
+            co = (v1.co + v2.co) / 2
+        return self.split_edge_at(edge, co)
+
+    def connect(self, face, v1, v2):
+        if v1 == v2 or is_adjacent(v1, v2):
+            return
+        self.tree.invalidate([face])
+        bmesh.utils.face_split(face, v1, v2)
+        self.edits += 1
+
+    def finish(self, face, current, target_type, target):
+        if target_type == 'VERT':
+            self.connect(face, current, target)
+            return target
+        if target_type == 'EDGE':
+            vert = self.split_edge_at(target, self.end_co)
+            self.connect(face, current, vert)
+            return vert
+        # the end point is inside the face
+        self.tree.invalidate([face])
+        vert = bmesh.ops.poke(self.bm, faces = [face])['verts'][0]
+        vert.co = self.end_co
+        dissolve_redundant_edges(self.bm, vert, excluded_verts = [current])
+        self.edits += 1
+        return vert
+
+    def contains_target(self, face, target_type, target):
+        if target_type == 'VERT':
+            return target in face.verts
+        if target_type == 'EDGE':
+            return target in face.edges
+        if target_type == 'FACE':
+            return target == face
+        return False
+
+    def cut(self, start, end_co):
+        """Cuts from the start BMVert to the end point. Returns the end BMVert or None."""
+        edits = self.edits
+        end = self.walk(start, end_co)
+        if not end:
+            self.missed += 1
+            if self.edits != edits:
+                self.partial += 1
+        return end
+
+    def walk(self, start, end_co):
+        util = self.util
+        self.start_co = start.co.copy()
+        self.end_co = end_co.copy()
+        self.epsilon = max((end_co - start.co).length, 1) * 1e-6
+        self.start_px = util.location_3d_to_region_2d_object_space(start.co)
+        end_px = util.location_3d_to_region_2d_object_space(end_co)
+        if not self.start_px or not end_px:
+            return None
+        self.axis_px = end_px - self.start_px
+        if self.axis_px.length < 1:
+            return None
+        mid_px = (self.start_px + end_px) / 2
+        view_origin, view_direction = util.get_view_object_space(mid_px.x, mid_px.y)
+        self.view_direction = view_direction
+        normal = (end_co - start.co).cross(view_direction)
+        if normal.length == 0:
+            return None
+        normal.normalize()
+        self.normal = normal
+
+        target_type, target = self.resolve_target(end_co)
+        if target_type == 'VERT' and target == start:
+            return start
+
+        self.path_verts.append(start)
+        current = start
+        t_current = 0
+        faces = list(start.link_faces)
+        for _ in range(self.max_steps):
+            for face in faces:
+                if self.contains_target(face, target_type, target):
+                    end = self.finish(face, current, target_type, target)
+                    self.path_verts.append(end)
+                    return end
+
+            best = None
+            best_face = None
+            for face in faces:
+                res = self.find_exit(face, current, t_current)
+                if not res:
+                    continue
+                # prefer faces which are looking at the viewer
+                front = face.normal.dot(view_direction) < 0
+                key = (not front, res[0])
+                if not best or key < best[0]:
+                    best = (key, res)
+                    best_face = face
+            if not best:
+                return None
+            t, vert, edge, co = best[1]
+            if t > 1 + 1e-3:
+                # the end point was not reached on this surface
+                return None
+            if not vert:
+                vert = self.split_edge(edge, co)
+            self.connect(best_face, current, vert)
+            self.path_verts.append(vert)
+            faces = [f for f in vert.link_faces if not current in f.verts]
+            current = vert
+            t_current = t
+        return None
+
+    def changed_faces(self, first = 0):
+        """Faces around the path verts, from the path vert with index first on."""
+        return set([f for v in self.path_verts[first:] for f in v.link_faces])
@@ -15,7 +15,7 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-import bpy, _thread, time
+import bpy, _thread, time, math
 import rna_keymap_ui
 from bpy.app.translations import contexts as i18n_contexts
 from bpy.app.handlers import persistent
@@ -40,6 +40,8 @@ user_prefs = bpy.context.preferences.themes[0].view_3d
 class HalfKnifePreferencesDefaults():
     snap_vertex_distance = 20
     snap_edge_distance = 15
+    use_snap_grid = True
+    angle_constraint_increment = 0.0
 
     cutting_edge = tuple(user_prefs.nurb_vline) + (1,)
     vertex = tuple(user_prefs.handle_sel_vect) + (1,)
@@ -55,6 +57,22 @@ class HalfKnifePreferencesDefaults():
     edge_autofix_distance = 0.0001
 
     use_profiler = False
+    frame_budget = 8.0
+    profiler_history_size = 32
+    profiler_trace_path = ""
+
+    cut_engine = 'KNIFE_PROJECT'
+    cut_through_layers = 0
+
+    preview_max_fps = 60
+
+    max_start_vertices = 2000
+
+    use_view_bvh = False
+    view_bvh_margin = .5
+
+    bvh_cache_size = 4
+    use_bvh_prewarm = False
 
     # cutting_edge = (0.603827, 0.000000, 0.318547, 1.000000)
     # vertex = (0.051269, 0.527115, 0.029557, 1.000000)
@@ -81,9 +99,55 @@ class HalfKnifePreferences(bpy.types.AddonPreferences):
     edge_autofix_distance : bpy.props.FloatProperty(name = "Edge autofix merge distance", default = defaults.edge_autofix_distance)
 
     use_profiler : bpy.props.BoolProperty(name = "Print performance log to console", default = defaults.use_profiler)
+    frame_budget : bpy.props.FloatProperty(name = "Frame budget (ms)",
+        description = "Interactive events slower than this are reported by the profiler",
+        default = defaults.frame_budget, min = 1, max = 100)
+    profiler_history_size : bpy.props.IntProperty(name = "Profiled cuts",
+        description = "How many of the last cuts the profiler stats and the trace cover",
+        default = defaults.profiler_history_size, min = 1, max = 1024)
+    profiler_trace_path : bpy.props.StringProperty(name = "Trace file",
+        description = "The profiled cuts are written here when the operator ends, as CSV for a .csv file and as a Chrome trace otherwise",
+        default = defaults.profiler_trace_path, subtype = 'FILE_PATH')
+
+    cut_engine : bpy.props.EnumProperty(name = "Cut engine",
+        items = [("KNIFE_PROJECT", "Knife project", "Project a temporary cut object with the knife project operator"),
+            ("BMESH", "Native bmesh", "Split crossed faces directly in the edit mesh. Cut through uses knife project"),],
+        default = defaults.cut_engine)
+
+    cut_through_layers : bpy.props.IntProperty(name = "Cut through layers",
+        description = "How many surfaces along the view the cut through mode cuts. 0 cuts all of them",
+        default = defaults.cut_through_layers, min = 0)
+
+    preview_max_fps : bpy.props.IntProperty(name = "Preview updates per second",
+        description = "Mouse moves are coalesced and the preview is updated at most this often. 0 updates on every mouse move",
+        default = defaults.preview_max_fps, min = 0, max = 240)
+
+    max_start_vertices : bpy.props.IntProperty(name = "Max selected vertices",
+        description = "The cut is canceled when more vertices are selected. 0 means no limit",
+        default = defaults.max_start_vertices, min = 0)
+
+    use_view_bvh : bpy.props.BoolProperty(name = "Pick only in view",
+        description = "Build the picking structures only from the faces in view. Faster start on very large meshes",
+        default = defaults.use_view_bvh)
+    view_bvh_margin : bpy.props.FloatProperty(name = "View margin",
+        description = "How far out of the view faces are still picked, as a fraction of the view size. The structures are rebuilt when the view moves farther",
+        default = defaults.view_bvh_margin, min = 0, max = 10)
+
+    bvh_cache_size : bpy.props.IntProperty(name = "Cached meshes",
+        description = "How many meshes keep their picking structures between cuts. 0 disables the cache",
+        default = defaults.bvh_cache_size, min = 0, max = 64)
+    use_bvh_prewarm : bpy.props.BoolProperty(name = "Prepare on entering edit mode",
+        description = "Build the picking structures of the active mesh right after entering edit mode, so the first cut starts instantly",
+        default = defaults.use_bvh_prewarm)
 
     snap_vertex_distance : bpy.props.IntProperty(name = "Vertex snap distance (pixels)", default = defaults.snap_vertex_distance)
     snap_edge_distance : bpy.props.IntProperty(name = "Edge snap distance (pixels)", default = defaults.snap_edge_distance)
+    use_snap_grid : bpy.props.BoolProperty(name = "Snap across faces",
+        description = "Snap to visible verts and edges of any face near the cursor, not only of the face under it",
+        default = defaults.use_snap_grid)
+    angle_constraint_increment : bpy.props.FloatProperty(name = "Angle constraint increment",
+        description = "The angle constraint axes turn from the bisector of the face corner by every multiple of this angle. 0 uses the bisector and the directions halfway to the corner edges",
+        default = defaults.angle_constraint_increment, min = 0, max = math.pi / 2, subtype = 'ANGLE')
 
     cutting_edge : bpy.props.FloatVectorProperty(name="Cutting edge",
         default=defaults.cutting_edge,
@@ -152,9 +216,21 @@ class HalfKnifePreferences(bpy.types.AddonPreferences):
         col.label(text="Snap settings:")
         col.prop(self, "snap_vertex_distance")
         col.prop(self, "snap_edge_distance")
+        col.prop(self, "use_snap_grid")
+        col.prop(self, "angle_constraint_increment")
 
         col.separator()
         col.prop(self, "disable_knife_icon")
+        col.prop(self, "cut_engine")
+        col.prop(self, "cut_through_layers")
+        col.prop(self, "preview_max_fps")
+        col.prop(self, "max_start_vertices")
+        col.prop(self, "use_view_bvh")
+        if self.use_view_bvh:
+            col.prop(self, "view_bvh_margin")
+        col.prop(self, "bvh_cache_size")
+        if self.bvh_cache_size > 0 and not self.use_view_bvh:
+            col.prop(self, "use_bvh_prewarm")
 
         #col.separator()
         #col.prop(self, "use_edge_autofix")
@@ -162,6 +238,11 @@ class HalfKnifePreferences(bpy.types.AddonPreferences):
 
         #col.separator()
         #col.prop(self, "use_profiler")
+        if self.use_profiler:
+            col.separator()
+            col.prop(self, "frame_budget")
+            col.prop(self, "profiler_history_size")
+            col.prop(self, "profiler_trace_path")
 
     def draw_colors(self, layout):
         layout.use_property_split = True
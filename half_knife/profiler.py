@@ -15,40 +15,347 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
+# start() opens a record, lap() and scope() add timed events to it and finish()
+# puts it into the history. A scope used outside of a record makes its own
+# record, which isn't printed. The history keeps the last `history_size` records
+# for stats() and the exports. count() adds to the counters of the session and
+# of the open record.
 
 import time
-
-last_time = 0
-start_time = 0
+import json
+import csv
+import functools
+import bisect
+from collections import deque
 
 enabled = True
+history_size = 32
+
+history = deque(maxlen = history_size)
+record = None
+stack = []
+last_mark = 0
+
+
+class Event:
+    __slots__ = ("name", "depth", "start", "end")
+
+    def __init__(self, name, depth, start, end = None):
+        self.name = name
+        self.depth = depth
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+class Record:
+    """Events of one measured operation, times are in perf_counter_ns."""
+
+    def __init__(self, name, start, verbose):
+        self.name = name
+        self.start = start
+        self.verbose = verbose
+        self.events = []
+        self.counters = {}
+
+
+class Scope:
+    __slots__ = ("name", "event")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.event = open_event(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        close_event(self.event)
+        return False
+
+
+class NullScope:
+    def __enter__(self):
+        return self
 
+    def __exit__(self, *exc):
+        return False
 
-def msg(time, message):
-    print(("%.2f" % (time* 1000)) + "ms: " + message)
+null_scope = NullScope()
 
-def start():
-    global last_time, start_time, enabled
+
+def msg(time, message, depth = 0):
+    print("  " * depth + ("%.2f" % (time* 1000)) + "ms: " + message)
+
+def set_history_size(size):
+    global history, history_size
+    if size == history_size:
+        return
+    history_size = size
+    history = deque(history, maxlen = size)
+
+def open_event(name, verbose = False):
+    global record, last_mark
+    now = time.perf_counter_ns()
+    if not stack:
+        record = Record(name, now, verbose)
+    event = Event(name, len(stack), now)
+    stack.append(event)
+    last_mark = now
+    return event
+
+def close_event(event):
+    global record, last_mark
+    if not event in stack:
+        # its record was dropped by start()
+        return
+    now = time.perf_counter_ns()
+    event.end = now
+    last_mark = now
+    # scopes left open by an exception are closed together with the outer one
+    while stack and stack.pop() is not event:
+        pass
+    current = record
+    current.events.append(event)
+    if not stack:
+        history.append(current)
+        record = None
+    elif current.verbose:
+        msg(event.duration / 1e9, event.name, event.depth - 1)
+
+def scope(name):
+    """Context manager timing a nested phase. Almost free when the profiler is disabled."""
+    if not enabled:
+        return null_scope
+    return Scope(name)
+
+def profile(name = None):
+    """Decorator timing every call of a function as a scope."""
+    def decorator(fn):
+        label = name or fn.__qualname__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return fn(*args, **kwargs)
+            with Scope(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def start(name = "Cut"):
+    global enabled
     if not enabled:
         return
-    last_time = time.time()
-    start_time = last_time
+    # a record which wasn't finished is dropped
+    stack.clear()
+    open_event(name, verbose = True)
     print("---------------------------------")
     print("--------------START--------------")
     print("---------------------------------")
 
 
 def lap(message):
-    global last_time, enabled
-    if not enabled:
+    global last_mark, enabled
+    if not enabled or not stack:
         return
-    current = time.time()
-    msg(current - last_time, message)
-    last_time = current
+    current = time.perf_counter_ns()
+    event = Event(message, len(stack), last_mark, current)
+    record.events.append(event)
+    if record.verbose:
+        msg(event.duration / 1e9, message, event.depth - 1)
+    last_mark = current
 
 def finish():
-    global start_time, enabled
+    global enabled
+    if not enabled or not stack:
+        return
+    root = stack[0]
+    current = record
+    close_event(root)
+    msg(root.duration / 1e9, "Time total")
+    for name, value in current.counters.items():
+        print(name + ": " + str(value))
+
+def percentile(values, q):
+    # nearest rank of sorted values
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+def stats(record_name = None):
+    """Per phase count, mean, p50, p95 and max in milliseconds over the history."""
+    durations = {}
+    for r in history:
+        if record_name and r.name != record_name:
+            continue
+        for e in r.events:
+            durations.setdefault(e.name, []).append(e.duration / 1e6)
+    result = {}
+    for name, values in durations.items():
+        values.sort()
+        result[name] = {
+            "count": len(values),
+            "mean": sum(values) / len(values),
+            "p50": percentile(values, .5),
+            "p95": percentile(values, .95),
+            "max": values[-1],
+        }
+    return result
+
+def print_stats(record_name = None):
+    global enabled
+    if not enabled:
+        return
+    print("%-40s %6s %9s %9s %9s %9s" % ("phase", "count", "mean", "p50", "p95", "max"))
+    for name, s in stats(record_name).items():
+        print("%-40s %6d %7.2fms %7.2fms %7.2fms %7.2fms" % (name, s["count"], s["mean"], s["p50"], s["p95"], s["max"]))
+
+def export_chrome_trace(path):
+    """Writes the history as Chrome trace events, it opens in chrome://tracing or Perfetto."""
+    origin = history[0].start if history else 0
+    events = []
+    for i, r in enumerate(history):
+        for e in r.events:
+            events.append({
+                "name": e.name,
+                "cat": r.name,
+                "ph": "X",
+                "ts": (e.start - origin) / 1000,
+                "dur": e.duration / 1000,
+                "pid": 1,
+                "tid": 1,
+                "args": {"record": i, "depth": e.depth},
+            })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+def export_csv(path):
+    with open(path, "w", newline = "") as f:
+        writer = csv.writer(f)
+        writer.writerow(["record", "record_name", "phase", "depth", "start_ms", "duration_ms"])
+        for i, r in enumerate(history):
+            for e in r.events:
+                writer.writerow([i, r.name, e.name, e.depth, (e.start - r.start) / 1e6, e.duration / 1e6])
+
+def export(path):
+    """Writes the history as CSV if the path ends with .csv, as a Chrome trace otherwise."""
+    if path.lower().endswith(".csv"):
+        export_csv(path)
+    else:
+        export_chrome_trace(path)
+
+def report(path = ""):
+    """Prints the stats of the history and exports it when a path is given. Operators call it when they end."""
+    if not enabled:
+        return
+    print_stats()
+    if path:
+        export(path)
+
+class LatencyScope:
+    __slots__ = ("monitor", "name", "is_event", "start")
+
+    def __init__(self, monitor, name, is_event):
+        self.monitor = monitor
+        self.name = name
+        self.is_event = is_event
+
+    def __enter__(self):
+        if self.is_event:
+            self.monitor.current = {}
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter_ns() - self.start
+        if self.is_event:
+            self.monitor.add_event(self.name, duration)
+        else:
+            self.monitor.add_phase(self.name, duration)
+        return False
+
+
+class LatencyMonitor:
+    """Latency of the interactive events, split into phases.
+
+    Every kind of event gets a histogram. Events longer than the frame budget
+    are printed with their phases as soon as they happen.
+    """
+
+    # histogram bucket bounds in milliseconds
+    bounds = (1, 2, 4, 8, 16, 33, 66)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, budget = 8):
+        self.budget = budget
+        self.histograms = {}
+        self.durations = {}
+        self.over_budget = {}
+        self.current = None
+
+    def event(self, name):
+        """Times an event. Phases inside of it are added to its breakdown."""
+        if not enabled:
+            return null_scope
+        return LatencyScope(self, name, True)
+
+    def phase(self, name):
+        if not enabled or self.current is None:
+            return null_scope
+        return LatencyScope(self, name, False)
+
+    def add_phase(self, name, duration):
+        self.durations.setdefault(name, []).append(duration)
+        self.current[name] = self.current.get(name, 0) + duration
+
+    def add_event(self, name, duration):
+        phases = self.current
+        self.current = None
+        self.durations.setdefault(name, []).append(duration)
+        histogram = self.histograms.setdefault(name, [0] * (len(self.bounds) + 1))
+        ms = duration / 1e6
+        histogram[bisect.bisect_right(self.bounds, ms)] += 1
+        if ms > self.budget:
+            self.over_budget[name] = self.over_budget.get(name, 0) + 1
+            parts = ", ".join(["%s %.2fms" % (n, d / 1e6) for n, d in phases.items()])
+            print("Over the frame budget: %s %.2fms (%s)" % (name, ms, parts))
+
+    def summary(self):
+        if not enabled or not self.durations:
+            return
+        print("Latency, frame budget %.1fms:" % self.budget)
+        print("%-24s %6s %9s %9s %9s %9s" % ("", "count", "mean", "p50", "p95", "max"))
+        for name, values in self.durations.items():
+            values = sorted([v / 1e6 for v in values])
+            print("%-24s %6d %7.2fms %7.2fms %7.2fms %7.2fms" % (name, len(values), sum(values) / len(values),
+                percentile(values, .5), percentile(values, .95), values[-1]))
+        labels = ["<%gms" % b for b in self.bounds] + [">%gms" % self.bounds[-1]]
+        for name, histogram in self.histograms.items():
+            print(name + " histogram: " + ", ".join(["%s: %d" % (l, c) for l, c in zip(labels, histogram) if c]))
+            print(name + " over the budget: %d" % self.over_budget.get(name, 0))
+
+latency = LatencyMonitor()
+
+counters = {}
+
+def count(name, value = 1):
+    global enabled
+    if not enabled:
+        return
+    counters[name] = counters.get(name, 0) + value
+    # also per record, finish() prints them
+    if record:
+        record.counters[name] = record.counters.get(name, 0) + value
+
+def reset_counters():
+    counters.clear()
+
+def print_counters():
+    global enabled
     if not enabled:
         return
-    current = time.time()
-    msg(current - start_time, "Time total")
+    for name, value in counters.items():
+        print(name + ": " + str(value))
@@ -0,0 +1,47 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+from collections import OrderedDict
+from .geometry_math import FaceSnapData
+from . import profiler
+
+
+class SnapCache:
+    """LRU cache of FaceSnapData for the faces under the cursor.
+
+    Entries are keyed by the face, the view version of the projector and the
+    mesh generation, so a view change or an edit never returns stale data.
+    """
+
+    def __init__(self, util, size = 256):
+        self.util = util
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, face, mesh_generation):
+        self.util.projector.sync()
+        key = (face, self.util.projector.version, mesh_generation)
+        data = self.items.get(key)
+        if data:
+            self.items.move_to_end(key)
+            profiler.count("Snap cache hits")
+            return data
+        profiler.count("Snap cache misses")
+        data = self.items[key] = FaceSnapData(face, self.util)
+        if len(self.items) > self.size:
+            self.items.popitem(last = False)
+        return data
@@ -0,0 +1,202 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+from .geometry_core import clip_segments, sample_segments
+from .mesh_arrays import face_loops
+from . import profiler
+
+
+class SnapGrid:
+    """Uniform grid of the projected verts and edges for snapping across faces.
+
+    The arrays come from SharedMeshArrays, the topology is derived from them
+    again when they are read again. The grid is rebuilt when the view or the
+    coordinates change. With a ViewFilter only the faces it kept are
+    projected, otherwise all unhidden elements. Hidden and backfacing
+    elements are left out at build time. Occlusion is tested with a ray cast
+    only for the few candidates near the cursor.
+    """
+
+    def __init__(self, bm, util, tree, source, radius, xray = False):
+        self.bm = bm
+        self.util = util
+        self.tree = tree
+        self.source = source
+        # every element closer than the radius is in the 3×3 cells around the cursor
+        self.cell = max(2 * radius, 4)
+        self.xray = xray
+        self.arrays = None
+        self.build_key = None
+
+    def ensure(self):
+        bm = self.bm
+        source = self.source
+        view = self.tree.view
+        if view:
+            # the faces of the view filter have to be from the current view and arrays
+            self.tree.ensure_view()
+            if view.arrays is not source.get():
+                self.tree.rebuild(mesh_changed = False)
+        if source.get() is not self.arrays:
+            self.gather(source.get())
+        # the element lookup follows the array order while the topology is the same
+        bm.verts.ensure_lookup_table()
+        bm.edges.ensure_lookup_table()
+        projector = self.util.projector
+        projector.sync()
+        key = (projector.version, source.version, self.tree.generation)
+        if key != self.build_key:
+            self.build()
+            self.build_key = key
+
+    def gather(self, arrays):
+        self.arrays = arrays
+        # moved verts are written into the shared arrays
+        self.co = arrays.co
+        self.vert_hidden = arrays.vert_hide
+        self.edge_verts = arrays.edge_verts.astype(np.int64)
+        self.edge_hidden = arrays.edge_hide
+        self.face_normals = arrays.face_normals
+        self.face_first_vert = arrays.loop_vert[arrays.loop_start].astype(np.int64)
+        self.loop_face = np.repeat(np.arange(len(arrays.loop_total)), arrays.loop_total)
+        self.loop_vert = arrays.loop_vert.astype(np.int64)
+        self.loop_edge = arrays.loop_edge.astype(np.int64)
+        self.unhidden_faces = np.flatnonzero(~arrays.face_hide)
+
+    def front_faces(self, faces):
+        # the view ray through the first vert of every face. It doesn't depend on the object scale
+        px = self.px[self.face_first_vert[faces]]
+        origins, directions = self.util.projector.unproject(np.nan_to_num(px))
+        front = (self.face_normals[faces] * directions).sum(axis = 1) < 0
+        return front & ~np.isnan(px[:, 0])
+
+    def build(self):
+        projector = self.util.projector
+        cell = self.cell
+        self.cols = int(projector.width // cell) + 3
+        self.rows = int(projector.height // cell) + 3
+        self.visible_verts = {}
+
+        view = self.tree.view
+        faces = view.ids if view else self.unhidden_faces
+        loops = face_loops(self.arrays, faces)
+        loop_vert = self.loop_vert[loops]
+        loop_edge = self.loop_edge[loops]
+        nv = len(self.co)
+        ne = len(self.edge_verts)
+        if view:
+            verts = np.unique(loop_vert)
+            edges = np.unique(loop_edge)
+        else:
+            # loose elements too
+            verts = np.arange(nv)
+            edges = np.arange(ne)
+
+        px = self.px = np.full((nv, 2), np.nan)
+        px[verts] = self.util.project_array(self.co[verts])
+        valid = ~np.isnan(px[:, 0])
+        vert_ok = np.zeros(nv, dtype = bool)
+        vert_ok[verts] = valid[verts] & ~self.vert_hidden[verts]
+        edge_ok = np.zeros(ne, dtype = bool)
+        edge_ok[edges] = valid[self.edge_verts[edges]].all(axis = 1) & ~self.edge_hidden[edges]
+        if not self.xray and len(faces):
+            # an element is backfacing when all of its faces are. Loose elements are kept
+            front = np.zeros(len(self.face_normals), dtype = bool)
+            front[faces] = self.front_faces(faces)
+            loop_front = front[self.loop_face[loops]]
+            vert_ok &= (np.bincount(loop_vert, weights = loop_front, minlength = nv) > 0) | (np.bincount(loop_vert, minlength = nv) == 0)
+            edge_ok &= (np.bincount(loop_edge, weights = loop_front, minlength = ne) > 0) | (np.bincount(loop_edge, minlength = ne) == 0)
+
+        indices = np.flatnonzero(vert_ok)
+        keys, inside = self.cell_keys(px[indices])
+        self.vert_keys, self.vert_items = self.sort_items(keys[inside], indices[inside])
+
+        indices = np.flatnonzero(edge_ok)
+        ends = px[self.edge_verts[indices]]
+        lo = (-cell, -cell)
+        hi = (projector.width + cell, projector.height + cell)
+        keep, a, b = clip_segments(ends[:, 0], ends[:, 1], lo, hi)
+        indices, a, b = indices[keep], a[keep], b[keep]
+        # samples not farther than a cell from each other put the edge into every cell it crosses
+        segment, points = sample_segments(a, b, cell)
+        keys, inside = self.cell_keys(points)
+        ne = max(ne, 1)
+        pairs = np.unique(keys[inside] * ne + indices[segment[inside]])
+        self.edge_keys = pairs // ne
+        self.edge_items = pairs % ne
+        profiler.count("Snap grid builds")
+
+    def cell_keys(self, px):
+        cells = np.floor(px / self.cell).astype(np.int64) + 1
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < self.cols) & (cells[:, 1] >= 0) & (cells[:, 1] < self.rows)
+        return cells[:, 0] * self.rows + cells[:, 1], inside
+
+    def sort_items(self, keys, items):
+        order = np.argsort(keys, kind = 'stable')
+        return keys[order], items[order]
+
+    def candidates(self, keys, items, x, y):
+        cx = int(x // self.cell) + 1
+        cy = int(y // self.cell) + 1
+        columns = np.arange(max(cx - 1, 0), min(cx + 2, self.cols))
+        if not len(columns) or cy + 1 < 0 or cy - 1 >= self.rows:
+            return items[:0]
+        # the cells of one column are consecutive keys
+        lo = columns * self.rows + max(cy - 1, 0)
+        hi = columns * self.rows + min(cy + 1, self.rows - 1)
+        starts = np.searchsorted(keys, lo, 'left')
+        ends = np.searchsorted(keys, hi, 'right')
+        return np.concatenate([items[s:e] for s, e in zip(starts, ends)])
+
+    def is_vert_visible(self, index):
+        visible = self.visible_verts.get(index)
+        if visible is None:
+            visible = self.xray or self.util.is_visible(self.tree, self.bm.verts[index].co)
+            self.visible_verts[index] = visible
+        return visible
+
+    def find_vert(self, x, y, radius, excluded = []):
+        """The closest visible BMVert within radius pixels or None."""
+        indices = self.candidates(self.vert_keys, self.vert_items, x, y)
+        if not len(indices):
+            return None
+        d = np.sqrt(((self.px[indices] - (x, y)) ** 2).sum(axis = 1))
+        for i in np.argsort(d):
+            if d[i] > radius:
+                break
+            vert = self.bm.verts[indices[i]]
+            if not vert in excluded and self.is_vert_visible(indices[i]):
+                return vert
+        return None
+
+    def find_edge(self, x, y, radius):
+        """The closest visible BMEdge within radius pixels and the object space point on it, or None, None."""
+        indices = np.unique(self.candidates(self.edge_keys, self.edge_items, x, y))
+        if not len(indices):
+            return None, None
+        ends = self.px[self.edge_verts[indices]]
+        d, t = self.util.point_to_segments_distance_2d((x, y), ends[:, 0], ends[:, 1])
+        for i in np.argsort(d):
+            if d[i] > radius:
+                break
+            edge = self.bm.edges[indices[i]]
+            v1, v2 = [v.co for v in edge.verts]
+            co = self.util.edge_point_under_pixel(v1, v2, *(ends[i, 0] + t[i] * (ends[i, 1] - ends[i, 0])))
+            if self.xray or self.util.is_visible(self.tree, co):
+                return edge, co
+        return None, None
@@ -0,0 +1,282 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+from mathutils.bvhtree import BVHTree
+from .mesh_arrays import face_loops
+
+
+class ViewFilter:
+    """Unhidden faces of an edit mesh in the view frustum grown by a margin.
+
+    The mesh arrays come from SharedMeshArrays, so faces out of the view cost
+    no Python time and the snap grid uses the same copy of the mesh. Moving the
+    view reuses them. The margin is a fraction of the view size. A selection
+    is kept until the view leaves its grown frustum, the snap grid takes its
+    faces from `ids`.
+    """
+
+    def __init__(self, projector, source, margin = .5):
+        self.projector = projector
+        self.source = source
+        self.margin = margin
+        self.matrix = None
+        self.version = None
+        self.arrays = None
+        self.bounds_key = None
+        self.ids = None
+
+    def read(self):
+        source = self.source
+        self.arrays = source.get()
+        if self.bounds_key == (source, source.version):
+            return
+        self.bounds_key = (source, source.version)
+        co = self.arrays.co
+        # bounding box corners for contains_view
+        lo, hi = (co.min(axis = 0), co.max(axis = 0)) if len(co) else (np.zeros(3), np.zeros(3))
+        self.corners = np.array([(x, y, z) for x in (lo[0], hi[0]) for y in (lo[1], hi[1]) for z in (lo[2], hi[2])])
+
+    def select(self):
+        """Indices of the faces in the grown frustum of the current view."""
+        self.projector.sync()
+        m = self.matrix = self.projector.np_object_to_clip.copy()
+        self.version = self.projector.version
+        arrays = self.arrays
+        clip = arrays.co @ m[:, :3].T + m[:, 3]
+        x, y, w = clip[:, 0], clip[:, 1], clip[:, 3]
+        k = 1 + self.margin
+        outside = np.zeros(len(clip), dtype = np.int8)
+        for bit, mask in enumerate((x > k * w, x < -k * w, y > k * w, y < -k * w, w <= 0)):
+            outside |= mask.astype(np.int8) << bit
+        if not len(arrays.loop_start):
+            return arrays.loop_start
+        # a face is out when all its verts are out of the same plane
+        face_outside = np.bitwise_and.reduceat(outside[arrays.loop_vert], arrays.loop_start)
+        return np.flatnonzero((face_outside == 0) & ~arrays.face_hide)
+
+    def build(self, bm):
+        """BVH over the selected faces and the BMFaces in its index order."""
+        self.read()
+        arrays = self.arrays
+        ids = self.ids = self.select()
+        if not len(ids):
+            return [], None
+        # mesh polygons are written in the order of the bmesh faces
+        bm.faces.ensure_lookup_table()
+        faces = [bm.faces[i] for i in ids]
+        counts = arrays.loop_total[ids]
+        loops = face_loops(arrays, ids)
+        used, local = np.unique(arrays.loop_vert[loops], return_inverse = True)
+        polygons = [p.tolist() for p in np.split(local, np.cumsum(counts)[:-1])]
+        return faces, BVHTree.FromPolygons(arrays.co[used].tolist(), polygons, all_triangles = False)
+
+    def contains_view(self):
+        """True if the part of the current view where the mesh can be is inside the grown frustum."""
+        projector = self.projector
+        projector.sync()
+        if projector.version == self.version:
+            return True
+        if self.matrix is None:
+            return False
+        w, h = projector.width, projector.height
+        origins, directions = projector.unproject(np.array(((0, 0), (w, 0), (0, h), (w, h), (w / 2, h / 2)), dtype = np.float64))
+        directions /= np.linalg.norm(directions, axis = 1)[:, None]
+        # the view between the depths of the mesh bounds is the hull of these corner points
+        axis = directions[4]
+        depth = (self.corners - origins[4]) @ axis
+        near, far = depth.min(), depth.max()
+        if projector.is_perspective:
+            if far <= 0:
+                self.version = projector.version
+                return True
+            near = max(near, far * 1e-3)
+        cos = (directions @ axis)[:, None]
+        points = np.vstack((origins + directions * near / cos, origins + directions * far / cos))
+        clip = points @ self.matrix[:, :3].T + self.matrix[:, 3]
+        k = 1 + self.margin
+        if ((clip[:, 3] > 0) & (np.abs(clip[:, 0]) <= k * clip[:, 3]) & (np.abs(clip[:, 1]) <= k * clip[:, 3])).all():
+            self.version = projector.version
+            return True
+        return False
+
+
+class SpatialIndex:
+    """Picking BVH over a bmesh which can be patched after small edits.
+
+    The base tree is built once with BVHTree.FromBMesh. Faces touched by an edit
+    are shadowed in the base tree and put into a small overlay tree which is
+    rebuilt lazily on the next query. Hits are resolved to BMFace objects through
+    face lists captured at build time, faces back to their slots by a dict.
+
+    With a ViewFilter only the faces in view are indexed and the tree is
+    rebuilt when the view leaves them.
+    """
+
+    # rebuild everything when the overlay gets bigger than this
+    overlay_limit = 1024
+    # how many shadowed faces a ray may pass through in the base tree
+    max_skips = 64
+    skip_epsilon = 1e-6
+    # hits closer to each other are the same surface, e.g. a ray through an edge
+    layer_epsilon = 1e-5
+    max_layers = 256
+
+    def __init__(self, bm, view = None):
+        self.bm = bm
+        self.view = view
+        # increased on every rebuild
+        self.generation = 0
+        self.rebuild()
+
+    def rebuild(self, mesh_changed = True):
+        bm = self.bm
+        if self.view:
+            if mesh_changed:
+                self.view.source.invalidate()
+            self.base_faces, self.base = self.view.build(bm)
+        else:
+            self.base = BVHTree.FromBMesh(bm)
+            # FromBMesh ensures face indices, so iteration order matches them
+            self.base_faces = list(bm.faces)
+        # face.index is renumbered once faces are killed, so it can't find the slot
+        self.base_lookup = dict(zip(self.base_faces, range(len(self.base_faces))))
+        self.generation += 1
+        self.shadowed = set()
+        self.overlay_faces = set()
+        self.overlay = None
+        self.overlay_map = []
+        self.overlay_dirty = False
+
+    def base_index(self, face):
+        return self.base_lookup.get(face, -1)
+
+    def ensure_view(self):
+        if self.view and not self.view.contains_view():
+            self.rebuild(mesh_changed = False)
+
+    def invalidate(self, faces):
+        """Call before editing or removing faces."""
+        for f in faces:
+            if f in self.overlay_faces:
+                self.overlay_faces.discard(f)
+                self.overlay_dirty = True
+                continue
+            i = self.base_index(f)
+            if i != -1:
+                self.shadowed.add(i)
+
+    def update(self, faces):
+        """Call after an edit with the new or modified faces."""
+        for f in faces:
+            i = self.base_index(f)
+            if i != -1:
+                self.shadowed.add(i)
+            self.overlay_faces.add(f)
+        self.overlay_dirty = True
+        if len(self.overlay_faces) > max(self.overlay_limit, len(self.base_faces) // 20):
+            self.rebuild()
+
+    def ensure_overlay(self):
+        if not self.overlay_dirty:
+            return
+        self.overlay_dirty = False
+        if not self.overlay_faces:
+            self.overlay = None
+            self.overlay_map = []
+            return
+        vertices = []
+        polygons = []
+        self.overlay_map = []
+        for f in self.overlay_faces:
+            start = len(vertices)
+            vertices.extend([v.co.copy() for v in f.verts])
+            polygons.append(range(start, len(vertices)))
+            self.overlay_map.append(f)
+        self.overlay = BVHTree.FromPolygons(vertices, polygons, all_triangles = False)
+
+    def ray_cast_base(self, origin, direction):
+        if not self.base:
+            return None, None, None, None
+        hit, normal, index, distance = self.base.ray_cast(origin, direction)
+        if not self.shadowed:
+            return hit, normal, index, distance
+        traveled = 0
+        skips = 0
+        while hit and index in self.shadowed and skips < self.max_skips:
+            traveled += distance + self.skip_epsilon
+            origin = hit + direction * self.skip_epsilon
+            hit, normal, index, distance = self.base.ray_cast(origin, direction)
+            skips += 1
+        if not hit or index in self.shadowed:
+            return None, None, None, None
+        return hit, normal, index, distance + traveled
+
+    def ray_cast(self, origin, direction):
+        """Returns hit, normal, BMFace, distance like BVHTree.ray_cast returns an index."""
+        self.ensure_view()
+        self.ensure_overlay()
+        direction = direction.normalized()
+        hit, normal, index, distance = self.ray_cast_base(origin, direction)
+        face = self.base_faces[index] if hit else None
+        if self.overlay:
+            o_hit, o_normal, o_index, o_distance = self.overlay.ray_cast(origin, direction)
+            # the overlay has the current faces, it wins ties
+            if o_hit and (not hit or o_distance <= distance):
+                hit, normal, face, distance = o_hit, o_normal, self.overlay_map[o_index], o_distance
+        if not hit:
+            return None, None, None, None
+        return hit, normal, face, distance
+
+    def find_nearest_range(self, co, distance):
+        """The faces closer to co than distance, whether they are seen or not."""
+        self.ensure_view()
+        self.ensure_overlay()
+        faces = []
+        # the view filter may have kept no faces
+        if self.base is not None:
+            shadowed = self.shadowed
+            faces = [self.base_faces[index] for hit, normal, index, d in self.base.find_nearest_range(co, distance) if not index in shadowed]
+        if self.overlay:
+            faces.extend(self.overlay_map[index] for hit, normal, index, d in self.overlay.find_nearest_range(co, distance))
+        return faces
+
+    def ray_cast_all(self, origin, direction, limit = 0):
+        """Hits of every surface along the ray sorted by depth, at most limit of them if it isn't 0."""
+        direction = direction.normalized()
+        limit = limit or self.max_layers
+        hits = []
+        traveled = 0
+        step = self.skip_epsilon
+        last_face = None
+        for i in range(self.max_layers * 4):
+            hit, normal, face, distance = self.ray_cast(origin, direction)
+            if not hit:
+                break
+            traveled += distance
+            if face == last_face or (hits and traveled - hits[-1][3] < self.layer_epsilon):
+                # the same surface again, step over it faster
+                step *= 10
+            else:
+                hits.append((hit, normal, face, traveled))
+                if len(hits) >= limit:
+                    break
+                step = self.skip_epsilon
+            last_face = face
+            origin = hit + direction * step
+            traveled += step
+        return hits
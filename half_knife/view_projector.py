@@ -0,0 +1,105 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import numpy as np
+from mathutils import Vector
+from . import geometry_core
+
+
+class ViewProjector:
+    """Cached transforms between region pixels and the object space.
+
+    The combined object to clip matrix and the inverse matrices are computed
+    only when the view, the object matrix or the region size changes. Every
+    change increases `version`, so other caches can be keyed by it.
+    Single points go through mathutils, arrays through NumPy.
+    """
+
+    def __init__(self, region, rv3d, matrix):
+        self.region = region
+        self.rv3d = rv3d
+        self.matrix = matrix
+        self.key = None
+        self.version = 0
+        self.sync()
+
+    def sync(self):
+        rv3d = self.rv3d
+        key = (rv3d.perspective_matrix.copy(), self.matrix.copy(), self.region.width, self.region.height)
+        if key == self.key:
+            return False
+        self.key = key
+        perspective_matrix, matrix, self.width, self.height = key
+        self.is_perspective = rv3d.is_perspective
+        # like region_2d_to_origin_3d, orthographic rays start at the near clip, except in a camera view
+        self.ortho_origin_z = 0 if rv3d.view_perspective == 'CAMERA' else -1
+        self.object_to_clip = perspective_matrix @ matrix
+        self.clip_to_world = perspective_matrix.inverted()
+        self.matrix_inv = matrix.inverted()
+        self.view_origin = rv3d.view_matrix.inverted().translation
+
+        self.np_object_to_clip = np.array(self.object_to_clip, dtype = np.float64)
+        self.np_clip_to_world = np.array(self.clip_to_world, dtype = np.float64)
+        self.np_matrix_inv = np.array(self.matrix_inv, dtype = np.float64)
+        self.np_view_origin = np.array(self.view_origin, dtype = np.float64)
+        self.version += 1
+        return True
+
+    def project_point(self, co):
+        """Object space point to region pixels. None if the point is behind the view."""
+        self.sync()
+        prj = self.object_to_clip @ Vector((co[0], co[1], co[2], 1))
+        if prj.w <= 0:
+            return None
+        return Vector(((1 + prj.x / prj.w) * self.width / 2, (1 + prj.y / prj.w) * self.height / 2))
+
+    def project(self, co):
+        """N×3 object space points to N×2 region pixels. Points behind the view are nan."""
+        self.sync()
+        return geometry_core.project_points(self.np_object_to_clip, self.width, self.height, co)
+
+    def unproject_world_point(self, x, y):
+        """Region pixel to the world space view ray. The direction is normalized."""
+        self.sync()
+        dx = 2 * x / self.width - 1
+        dy = 2 * y / self.height - 1
+        inv = self.clip_to_world
+        near = inv @ Vector((dx, dy, -1, 1))
+        far = inv @ Vector((dx, dy, 1, 1))
+        direction = (far.xyz / far.w - near.xyz / near.w).normalized()
+        if self.is_perspective:
+            origin = self.view_origin.copy()
+        else:
+            start = inv @ Vector((dx, dy, self.ortho_origin_z, 1))
+            origin = start.xyz / start.w
+        return origin, direction
+
+    def unproject_point(self, x, y):
+        """Region pixel to the object space view ray. The direction is one world unit long."""
+        origin, direction = self.unproject_world_point(x, y)
+        return self.matrix_inv @ origin, self.matrix_inv.to_3x3() @ direction
+
+    def unproject_world(self, px):
+        """N×2 region pixels to N×3 world space ray origins and normalized directions."""
+        self.sync()
+        return geometry_core.unproject_points(self.np_clip_to_world, self.width, self.height, px, self.is_perspective, self.np_view_origin, self.ortho_origin_z)
+
+    def unproject(self, px):
+        """N×2 region pixels to N×3 object space ray origins and directions one world unit long."""
+        origin, direction = self.unproject_world(px)
+        inv = self.np_matrix_inv
+        return origin @ inv[:3, :3].T + inv[:3, 3], direction @ inv[:3, :3].T